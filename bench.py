@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the renderer's CPU stages. Usage: python bench.py [name ...]"""
+
+import math, sys, time
+from typing import Callable, Dict
+import numpy as np
+import main
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {}
+
+def benchmark(fn: Callable[[], None]) -> Callable[[], None]:
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+def timeit(fn: Callable[[], object], repeat: int = 5) -> float:
+    """Best-of-`repeat` wall time of fn() in milliseconds."""
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+def build_ring(n_segments: int, subdivs: int):
+    step = main.ARC_SPAN / n_segments
+    angles = [main.ARC_START + step * (i + 0.5) for i in range(n_segments)]
+    segments = [main.make_curved_beveled_segment(a, (main.ARC_SPAN / n_segments) * 0.9, main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, subdivs) for a in angles]
+    return angles, segments
+
+def build_instanced_ring(n_segments: int, subdivs: int):
+    """The ring as main() draws it: one canonical segment, its instances and the frame assembled at that level."""
+    step = main.ARC_SPAN / n_segments
+    canonical = main.make_curved_beveled_segment(0.0, step * 0.9, main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, subdivs)
+    instances = main.make_ring_instances(canonical, main.ARC_START + step * (np.arange(n_segments) + 0.5))
+    return instances, main.assemble_lod([canonical], np.zeros(n_segments, dtype=np.int64))
+
+@benchmark
+def ordering() -> None:
+    """Centroid argsort vs analytic ring order."""
+    print(f"{'segments':>8} {'subdivs':>7} {'faces':>8} {'argsort':>9} {'analytic':>9}")
+    for n_segments, subdivs in ((12, 6), (120, 50), (1200, 20), (1200, 100)):
+        instances, frame = build_instanced_ring(n_segments, subdivs)
+        faces, layouts, level = frame.faces, [main.instance_layout(instances)], np.zeros(n_segments, dtype=np.int64)
+        view = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT)
+        mat = view @ main.rotation_matrix_z(main.BASE_AZIM)
+        depth = main.transform_instances(instances, mat).reshape(-1, 3)[:, 2]
+        t_sort = timeit(lambda: main.painter_order(depth, faces))
+        t_analytic = timeit(lambda: main.lod_painter_order(mat, layouts, level, frame.face_start))
+        print(f"{n_segments:>8} {subdivs:>7} {len(faces):>8} {t_sort:>7.2f}ms {t_analytic:>7.2f}ms")
+
+@benchmark
+def fill() -> None:
+    """Translucent face fills: Surface per face vs direct blend vs coverage compositing vs NumPy rasterizer."""
+    screen = main.pygame.Surface((main.WIDTH, main.HEIGHT))
+    print(f"{'subdivs':>7} {'view':>8} {'faces':>6} {'surface':>9} {'blend':>9} {'coverage':>9} {'numpy':>9} {'Surfaces/frame':>15}")
+    for subdivs in (main.SUBDIVISIONS, 24, 96):
+        instances, frame = build_instanced_ring(main.N_SEGMENTS, subdivs)
+        faces = frame.faces
+        for view, pitch in (("3/4", main.TILT), ("edge-on", math.radians(88))):
+            mat = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(pitch) @ main.rotation_matrix_z(main.BASE_AZIM)
+            x, y, _, _ = main.project_points(main.transform_instances(instances, mat).reshape(-1, 3))
+            face_xy = np.stack([x, y], axis=1)[faces]
+            polys = face_xy.tolist()
+            filler, compositor, rasterizer = main.TranslucentFiller(), main.CoverageCompositor(), main.NumpyRasterizer()
+            batches = np.split(face_xy, frame.face_start[1:-1])
+            def painter(fill_polygon) -> None:
+                for p in polys:
+                    fill_polygon(screen, p[::-1], main.FACE_FILL_BACK)
+                    fill_polygon(screen, p, main.FACE_FILL_FRONT)
+            t_surface = timeit(lambda: painter(main.draw_translucent_polygon), 2)
+            t_blend = timeit(lambda: painter(filler.fill), 2)
+            t_coverage = timeit(lambda: compositor.composite(screen, face_xy, face_xy), 2)
+            t_numpy = timeit(lambda: [rasterizer.composite(screen, batch, batch) for batch in batches], 2)
+            surfaces = main.SurfaceFiller()
+            painter(surfaces.fill) # One counted frame; the blend and compositor paths allocate no Surfaces
+            print(f"{subdivs:>7} {view:>8} {len(polys):>6} {t_surface:>7.2f}ms {t_blend:>7.2f}ms {t_coverage:>7.2f}ms {t_numpy:>7.2f}ms {surfaces.allocations:>15}")
+
+@benchmark
+def sides() -> None:
+    """Every face in both styles vs each face once, its fills merged or in the style of the side it shows:
+    classify + sort, then blended fills."""
+    screen = main.pygame.Surface((main.WIDTH, main.HEIGHT))
+    filler, merged = main.TranslucentFiller(), main.CoverageCompositor.merged()
+    print(f"{'subdivs':>7} {'faces':>6} {'entries':>15} {'sort both':>10} {'merged':>9} {'facing':>9} {'fill both':>10} {'merged':>9} {'facing':>9}")
+    for subdivs in (main.SUBDIVISIONS, 24, 96):
+        instances, frame = build_instanced_ring(main.N_SEGMENTS, subdivs)
+        faces = frame.faces
+        mat = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT) @ main.rotation_matrix_z(main.BASE_AZIM)
+        world = main.transform_instances(instances, mat).reshape(-1, 3)
+        x, y, _, _ = main.project_points(world)
+        face_xy = np.stack([x, y], axis=1)[faces]
+        both = lambda: main.painter_order(world[:, 2], faces)
+        once = lambda: main.painter_order(world[:, 2], faces, np.zeros(len(faces), dtype=bool))
+        facing = lambda: main.painter_order(world[:, 2], faces, main.back_facing(face_xy))
+        def fill(order: np.ndarray, front=main.FACE_FILL_FRONT) -> None:
+            for points_2d, is_back in zip(face_xy[order >> 1].tolist(), (order & 1).tolist()):
+                filler.fill(screen, points_2d, main.FACE_FILL_BACK if is_back else front)
+        t_both, t_once, t_facing = timeit(both), timeit(once), timeit(facing)
+        t_fill_both, t_fill_once, t_fill_facing = timeit(lambda: fill(both()), 2), timeit(lambda: fill(once(), merged), 2), timeit(lambda: fill(facing()), 2)
+        print(f"{subdivs:>7} {len(faces):>6} {len(both()):>7} -> {len(facing()):>5} {t_both:>8.2f}ms {t_once:>7.2f}ms {t_facing:>7.2f}ms "
+              f"{t_fill_both:>8.2f}ms {t_fill_once:>7.2f}ms {t_fill_facing:>7.2f}ms")
+
+@benchmark
+def lights() -> None:
+    """City lights: one pygame.draw.circle per light vs bucketed LightSplatter stamps."""
+    screen = main.pygame.Surface((main.WIDTH, main.HEIGHT))
+    angles, segments = build_ring(main.N_SEGMENTS, main.SUBDIVISIONS)
+    mat = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT) @ main.rotation_matrix_z(main.BASE_AZIM)
+    for per_segment in (200, 10_000, 100_000):
+        store = main.generate_light_store(segments, per_segment, np.random.default_rng(0))
+        x, y, visible, _ = main.project_points(store.positions @ mat.T)
+        splatter = main.LightSplatter(screen, store.sizes, store.colors)
+        t_splat = timeit(lambda: splatter.splat(screen, x, y, visible), 3)
+        if per_segment <= 10_000:
+            sizes, colors = np.maximum(1, store.sizes.astype(int)).tolist(), [tuple(c) for c in store.colors.tolist()]
+            xs, ys = x.astype(int).tolist(), y.astype(int).tolist()
+            t_circle = timeit(lambda: [main.pygame.draw.circle(screen, c, (a, b), r) for a, b, r, c in zip(xs, ys, sizes, colors)], 1)
+        else:
+            t_circle = math.nan
+        print(f"{len(x):>9} lights: circles {t_circle:>8.2f}ms, splat {t_splat:>7.2f}ms")
+
+@benchmark
+def picking() -> None:
+    """City light hover: build the frame's LightGrid, then nearest-light and rectangle queries vs linear scans."""
+    angles, segments = build_ring(main.N_SEGMENTS, main.SUBDIVISIONS)
+    mat = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT) @ main.rotation_matrix_z(main.BASE_AZIM)
+    for per_segment in (200, 10_000, 100_000):
+        store = main.generate_light_store(segments, per_segment, np.random.default_rng(0))
+        x, y, visible, _ = main.project_points(store.positions @ mat.T)
+        t_build = timeit(lambda: main.LightGrid(x, y, visible, (main.WIDTH, main.HEIGHT)), 3)
+        grid = main.LightGrid(x, y, visible, (main.WIDTH, main.HEIGHT))
+        cursors = [(cx, cy) for cx in range(100, main.WIDTH, 200) for cy in range(100, main.HEIGHT, 200)]
+        t_nearest = timeit(lambda: [grid.nearest(cx, cy, main.LIGHT_PICK_PIXELS) for cx, cy in cursors], 3) / len(cursors)
+        t_scan = timeit(lambda: [np.argmin(np.where(visible, (x - cx) ** 2 + (y - cy) ** 2, np.inf)) for cx, cy in cursors[:4]], 3) / 4
+        t_rect = timeit(lambda: [grid.in_rect(cx - 50, cy - 50, cx + 50, cy + 50) for cx, cy in cursors], 3) / len(cursors)
+        print(f"{len(x):>9} lights: grid {t_build:>7.2f}ms, nearest {t_nearest * 1000:>6.1f}us (scan {t_scan:>6.2f}ms), "
+              f"100px rectangle {t_rect * 1000:>7.1f}us")
+
+@benchmark
+def instancing() -> None:
+    """Per-frame vertex transform: packed per-segment copies vs one canonical segment plus per-instance matmul."""
+    mat = main.rotation_matrix_x(main.TILT) @ main.rotation_matrix_z(main.BASE_AZIM)
+    print(f"{'segments':>8} {'verts':>9} {'copies':>9} {'instanced':>9} {'stored copies':>14} {'stored instanced':>17}")
+    for n_segments in (12, 1200, 20_000):
+        step = main.ARC_SPAN / n_segments
+        angles = main.ARC_START + step * (np.arange(n_segments) + 0.5)
+        canonical = main.make_curved_beveled_segment(0.0, step * 0.9, main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, main.SUBDIVISIONS)
+        instances = main.make_ring_instances(canonical, angles)
+        copies = main.transform_instances(instances, np.eye(3)).reshape(-1, 3).astype(np.float32) # Per-segment copies of every vertex
+        out = np.empty((n_segments, len(canonical.verts), 3))
+        t_copies = timeit(lambda: copies @ mat.T, 10)
+        t_instanced = timeit(lambda: main.transform_instances(instances, mat, out=out), 10)
+        stored = canonical.verts.nbytes + instances.angles.nbytes + instances.scale.nbytes + instances.offset.nbytes
+        print(f"{n_segments:>8} {len(copies):>9} {t_copies:>7.2f}ms {t_instanced:>7.2f}ms {copies.nbytes / 1024:>12.0f}KB {stored / 1024:>15.0f}KB")
+
+@benchmark
+def culling() -> None:
+    """Zoomed-in views: transform + assemble + project every segment vs only the segments that pass cull_segments."""
+    saved = main.SCALE
+    mat = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT) @ main.rotation_matrix_z(main.BASE_AZIM)
+    for n_segments in (120, 1200):
+        step = main.ARC_SPAN / n_segments
+        lods = [main.make_curved_beveled_segment(0.0, step * 0.9, main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, 8)]
+        instances = main.make_ring_instances(lods[0], main.ARC_START + step * (np.arange(n_segments) + 0.5))
+        bounds = main.segment_bounds(instances)
+        for zoom in (1, 4, 8):
+            main.SCALE = saved * zoom
+            def frame(cull: bool) -> int:
+                level = np.where(main.cull_segments(instances, mat, bounds), 0, -1) if cull else np.zeros(n_segments, dtype=np.int64)
+                frame = main.assemble_lod(lods, level)
+                world = np.empty((frame.vert_start[-1], 3))
+                main.transform_lod(instances, lods, level, frame.vert_start, mat, world)
+                x, y, _, _ = main.project_points(world)
+                return int(main.faces_on_screen(np.stack([x, y], axis=1)[frame.faces], main.WIDTH, main.HEIGHT).sum()) if len(frame.faces) else 0
+            kept = int(main.cull_segments(instances, mat, bounds).sum())
+            print(f"{n_segments:>5} segments, zoom {zoom:>2}x: all {timeit(lambda: frame(False), 5):>6.2f}ms, "
+                  f"culled {timeit(lambda: frame(True), 5):>6.2f}ms ({kept} segments, {frame(True)} faces on screen)")
+    main.SCALE = saved
+
+@benchmark
+def bvh() -> None:
+    """FaceBVH: build and refit, then mouse picking and zoomed viewport culling vs linear scans over every face,
+    and the per-segment tree main() picks through (segment_tree + pick_segments)."""
+    mat = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT) @ main.rotation_matrix_z(main.BASE_AZIM)
+    print(f"{'faces':>8} {'build':>9} {'refit':>9} {'pick':>8} {'scan':>9} {'cull 4x':>9} {'scan':>9} {'seg build':>10} {'seg pick':>9}")
+    for n_segments, subdivs in ((12, 16), (120, 100), (1200, 100)):
+        step = main.ARC_SPAN / n_segments
+        mesh = main.make_curved_beveled_segment(0.0, step * 0.9, main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, subdivs)
+        instances = main.make_ring_instances(mesh, main.ARC_START + step * (np.arange(n_segments) + 0.5))
+        verts = main.transform_instances(instances, np.eye(3)).reshape(-1, 3)
+        faces = (mesh.faces + len(mesh.verts) * np.arange(n_segments)[:, None, None]).reshape(-1, 4)
+        t_build = timeit(lambda: main.FaceBVH(verts, faces), 1)
+        tree = main.FaceBVH(verts, faces)
+        t_refit = timeit(lambda: tree.refit(verts), 3)
+        pixels = [(x, y) for x in range(100, main.WIDTH, 250) for y in range(100, main.HEIGHT, 250)]
+        t_pick = timeit(lambda: [tree.pick(mat, 1.0, np.zeros(3), pos) for pos in pixels], 3) / len(pixels)
+        def scan(pos) -> None:
+            origin, direction, _ = main.view_ray(mat, 1.0, np.zeros(3), pos)
+            main.ray_quads(origin, direction, verts[faces]).argmin()
+        t_scan = timeit(lambda: scan(pixels[0]), 1)
+        zoom, pan = 4.0, -4.0 * np.array([main.R_OUTER, 0.0, 0.0])
+        t_cull = timeit(lambda: tree.cull(mat, zoom, pan), 3)
+        corners = verts[faces]
+        combined, shift = np.broadcast_to(zoom * mat, (len(faces), 3, 3)), np.broadcast_to(mat @ pan, (len(faces), 3))
+        t_cull_scan = timeit(lambda: main.boxes_on_screen(combined, shift, corners.min(axis=1), corners.max(axis=1)), 1)
+        t_seg_build = timeit(lambda: main.segment_tree(instances, main.segment_bounds(instances)), 3)
+        segments, level = main.segment_tree(instances, main.segment_bounds(instances)), np.zeros(n_segments, dtype=np.int64)
+        t_seg_pick = timeit(lambda: [main.pick_segments(segments, instances, [mesh], level, mat, 1.0, np.zeros(3), pos) for pos in pixels], 3) / len(pixels)
+        print(f"{len(faces):>8} {t_build:>7.1f}ms {t_refit:>7.1f}ms {t_pick:>6.2f}ms {t_scan:>7.1f}ms {t_cull:>7.1f}ms {t_cull_scan:>7.1f}ms "
+              f"{t_seg_build:>8.2f}ms {t_seg_pick:>7.2f}ms")
+
+@benchmark
+def perspective() -> None:
+    """Perspective fly-in: project + near-clip every face vs cull segments first, then clip only what survives."""
+    saved = main.PROJECTION, main.CAMERA_DISTANCE
+    main.PROJECTION = 'perspective'
+    mat = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT) @ main.rotation_matrix_z(main.BASE_AZIM)
+    for n_segments in (120, 1200):
+        step = main.ARC_SPAN / n_segments
+        lods = [main.make_curved_beveled_segment(0.0, step * 0.9, main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, 8)]
+        instances = main.make_ring_instances(lods[0], main.ARC_START + step * (np.arange(n_segments) + 0.5))
+        bounds = main.segment_bounds(instances)
+        for distance in (saved[1], 6.0, 3.0, 1.5):
+            main.CAMERA_DISTANCE = distance
+            def frame(cull: bool) -> int:
+                level = np.where(main.cull_segments(instances, mat, bounds), 0, -1) if cull else np.zeros(n_segments, dtype=np.int64)
+                frame = main.assemble_lod(lods, level)
+                world = np.empty((frame.vert_start[-1], 3))
+                main.transform_lod(instances, lods, level, frame.vert_start, mat, world)
+                x, y, _, _ = main.project_points(world)
+                face_xy, kept = main.project_faces(world, frame.faces, np.stack([x, y], axis=1))
+                return int((kept & main.faces_on_screen(face_xy, main.WIDTH, main.HEIGHT)).sum())
+            kept = int(main.cull_segments(instances, mat, bounds).sum())
+            print(f"{n_segments:>5} segments, eye at {distance:>5.2f}: all {timeit(lambda: frame(False), 5):>6.2f}ms, "
+                  f"culled {timeit(lambda: frame(True), 5):>6.2f}ms ({kept} segments, {frame(True)} faces drawn)")
+    main.PROJECTION, main.CAMERA_DISTANCE = saved
+
+@benchmark
+def streaming() -> None:
+    """Streamed rings: visible-set search and light streaming per frame, from the whole ring to real segments."""
+    mat = main.rotation_matrix_z(main.BASE_AZIM) # Looking down the ring axis, so deep zooms reach single segments
+    print(f"{'segments':>11} {'zoom':>7} {'stride':>7} {'drawn':>6} {'search':>8} {'lights':>9} {'cached':>7}")
+    for count in (10_000, 1_000_000, 100_000_000):
+        stream = main.SegmentStream(count, main.STREAM_BUDGET, main.STREAM_CACHE, main.STREAM_PREFETCH, seed=0)
+        point = mat @ [6.0, 0.0, 0.0]
+        for zoom in (1.0, 1e2, 1e4, 1e6):
+            pan = -zoom * mat.T @ point
+            stride, index = stream.visible(mat, zoom, pan)
+            search = timeit(lambda: stream.visible(mat, zoom, pan), 5)
+            lights = ""
+            if stride == 1:
+                view, level = stream.instances(1, index, zoom, pan), np.zeros(len(index), dtype=np.int64)
+                started = time.perf_counter()
+                stream.frame_lights(view, index, level)
+                lights = f"{(time.perf_counter() - started) * 1000:.2f}ms" # First visit: generated
+                if (future := stream.prefetch(index)) is not None: future.result()
+            print(f"{count:>11} {zoom:>7.0e} {stride:>7} {len(index):>6} {search:>6.2f}ms {lights:>9} {len(stream.lights):>7}")
+        stream.close()
+
+@benchmark
+def sweep() -> None:
+    """Sweeping each cross-section profile into a segment mesh (vertices, faces, flags and deduplicated edges)."""
+    for kind, make in sorted(main.PROFILES.items()):
+        profile = make(main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, main.BEVEL_SIZE)
+        times = [timeit(lambda: main.sweep_profile(profile, 0.0, main.ANGLE_SPAN, subdivs), 5) for subdivs in (16, 256, 4096)]
+        print(f"{kind:>6} ({len(profile.points):>2} points): " + ", ".join(f"{s} subdivs {t:.2f}ms" for s, t in zip((16, 256, 4096), times)))
+
+@benchmark
+def twist() -> None:
+    """Mobius ring: sweep + twisted transform vs untwisted, then depth sort + blended fills of the twisted ring."""
+    screen = main.pygame.Surface((main.WIDTH, main.HEIGHT))
+    mat = main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT) @ main.rotation_matrix_z(main.BASE_AZIM)
+    profile = main.box_profile(main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, main.BEVEL_SIZE)
+    filler = main.TranslucentFiller()
+    print(f"{'subdivs':>7} {'faces':>7} {'sweep':>8} {'flat':>8} {'twisted':>8} {'sort':>8} {'fill':>9}")
+    for subdivs in (16, 64, 256, 1024):
+        mesh = main.sweep_profile(profile, 0.0, main.ANGLE_SPAN, subdivs)
+        step = main.ARC_SPAN / main.N_SEGMENTS
+        angles = main.ARC_START + step * (np.arange(main.N_SEGMENTS) + 0.5)
+        flat = main.make_ring_instances(mesh, angles)
+        twisted = flat._replace(twist=math.pi / main.ARC_SPAN, twist_radius=(main.R_INNER + main.R_OUTER) / 2, twist_start=main.ARC_START)
+        t_sweep = timeit(lambda: main.sweep_profile(profile, 0.0, main.ANGLE_SPAN, subdivs), 3)
+        t_flat = timeit(lambda: main.transform_instances(flat, mat), 3)
+        t_twisted = timeit(lambda: main.transform_instances(twisted, mat), 3)
+        world = main.transform_instances(twisted, mat).reshape(-1, 3)
+        faces = (mesh.faces + (np.arange(main.N_SEGMENTS) * len(mesh.verts))[:, None, None]).reshape(-1, 4)
+        t_sort = timeit(lambda: main.painter_order(world[:, 2], faces), 3)
+        x, y, _, _ = main.project_points(world)
+        face_xy = np.stack([x, y], axis=1)[faces]
+        order, polys = main.painter_order(world[:, 2], faces).tolist(), [face_xy.tolist(), face_xy[:, ::-1].tolist()]
+        def fill() -> None:
+            for entry in order: filler.fill(screen, polys[entry & 1][entry >> 1], main.FACE_FILL_BACK if entry & 1 else main.FACE_FILL_FRONT)
+        t_fill = timeit(fill, 1)
+        print(f"{subdivs:>7} {len(faces):>7} {t_sweep:>6.2f}ms {t_flat:>6.2f}ms {t_twisted:>6.2f}ms {t_sort:>6.2f}ms {t_fill:>7.2f}ms")
+
+@benchmark
+def lod() -> None:
+    """Faces per frame and assembly cost: fixed finest level vs per-segment LOD chosen from projected arc length."""
+    chain = main.LOD_SUBDIVISIONS
+    views = (("3/4", main.rotation_matrix_y(main.INITIAL_YAW) @ main.rotation_matrix_x(main.TILT)), ("edge-on", main.rotation_matrix_x(math.radians(88))))
+    for n_segments in (12, 1200):
+        step = main.ARC_SPAN / n_segments
+        lods = [main.make_curved_beveled_segment(0.0, step * 0.9, main.R_INNER, main.R_OUTER, main.SEG_HEIGHT, s) for s in chain]
+        instances = main.make_ring_instances(lods[-1], main.ARC_START + step * (np.arange(n_segments) + 0.5))
+        arc = lods[-1].verts.reshape(chain[-1] + 1, -1, 3).mean(axis=1)
+        for name, mat in views:
+            def frame(level_of: Callable[[], np.ndarray]) -> int:
+                level = level_of()
+                frame = main.assemble_lod(lods, level)
+                main.transform_lod(instances, lods, level, frame.vert_start, mat, np.empty((frame.vert_start[-1], 3)))
+                return len(frame.faces)
+            finest = lambda: np.full(n_segments, len(chain) - 1)
+            chosen = lambda: main.select_lod(instances, mat, arc, chain, main.LOD_PIXELS)
+            print(f"{n_segments:>5} segments {name:>8}: fixed {frame(finest):>7} faces {timeit(lambda: frame(finest), 5):>6.2f}ms, "
+                  f"lod {frame(chosen):>7} faces {timeit(lambda: frame(chosen), 5):>6.2f}ms")
+
+@benchmark
+def startup() -> None:
+    """Scene generation vs loading the memory-mapped .npy cache (load_or_build)."""
+    import tempfile
+    saved = main.N_SEGMENTS, main.RNG_SEED
+    for n_segments in (12, 1200, 20_000):
+        main.N_SEGMENTS, main.RNG_SEED = n_segments, 0
+        with tempfile.TemporaryDirectory() as cache_dir:
+            t_build = timeit(lambda: main.load_or_build(None, main.scene_config(), main.build_scene), 1)
+            main.load_or_build(cache_dir, main.scene_config(), main.build_scene)
+            t_load = timeit(lambda: main.load_or_build(cache_dir, main.scene_config(), main.build_scene), 3)
+        print(f"{n_segments:>6} segments: generate {t_build:>9.2f}ms, cached {t_load:>6.2f}ms")
+    main.N_SEGMENTS, main.RNG_SEED = saved
+
+@benchmark
+def background() -> None:
+    """Starfield + glow: redraw every star and glow ring per frame vs cached 32-bit layer vs 8-bit palette layer."""
+    for (width, height), count in (((main.WIDTH, main.HEIGHT), main.BG_STAR_COUNT), ((3840, 2160), 100_000)):
+        screen = main.pygame.Surface((width, height))
+        started = time.perf_counter()
+        stars = main.generate_bg_stars(width, height, count, np.random.default_rng(0))
+        generated = (time.perf_counter() - started) * 1000
+        center = (width // 2, height // 2)
+        def redraw() -> None:
+            screen.fill(main.BACKGROUND)
+            for x, y, size, brightness, color, _ in stars.tolist():
+                b = brightness / 255.0
+                main.pygame.draw.circle(screen, (int(color[0] * b), int(color[1] * b), int(color[2] * b)), (x, y), size)
+            for r in range(main.STAR_GLOW_RADIUS, 0, -5):
+                glow = main.pygame.Surface((r * 2, r * 2), main.pygame.SRCALPHA)
+                main.pygame.draw.circle(glow, (255, 255, 255, 15), (r, r), r)
+                screen.blit(glow, (center[0] - r, center[1] - r))
+        def cached(layer: main.BackgroundLayer) -> None:
+            layer.twinkle()
+            layer.draw(screen)
+            layer.draw_glow(screen, center)
+        layer = main.BackgroundLayer((width, height), stars, np.random.default_rng(0))
+        indexed = main.IndexedBackgroundLayer((width, height), main.generate_bg_stars(width, height, count, np.random.default_rng(0), indexed=True), np.random.default_rng(0))
+        print(f"{width}x{height} {count:>7} stars: generate {generated:>6.2f}ms, redraw {timeit(redraw, 3):>8.2f}ms, cached {timeit(lambda: cached(layer), 3):>7.2f}ms, "
+              f"palette {timeit(lambda: cached(indexed), 3):>7.2f}ms")
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        print(f"== {name}: {BENCHMARKS[name].__doc__}")
+        BENCHMARKS[name]()
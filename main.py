@@ -14,10 +14,13 @@
 #                                                                              #
 ################################################################################
 
-import math, random, colorsys
-from typing import List, Tuple
+import functools, hashlib, math, os, re, shutil, tempfile, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 import numpy as np
 import pygame
+import pygame.gfxdraw
 
 # ----------------- Config -----------------
 WIDTH, HEIGHT, FPS = 1200, 900, 60
@@ -30,16 +33,33 @@ R_INNER, R_OUTER, SEG_HEIGHT = 4.5, 7.5, 2.5
 ANGLE_SPAN = (ARC_SPAN / N_SEGMENTS) * 0.90             # Small gaps between segments
 
 # Detail
-SUBDIVISIONS, BEVEL_SIZE = 6, 0.15                      # More subdivisions for smoother curves
+SUBDIVISIONS, BEVEL_SIZE = 6, 0.15                      # More subdivisions for smoother curves (fixed detail, LOD_PIXELS = None)
+PROFILE = 'box'                                         # Cross-section: 'box' (beveled by BEVEL_SIZE), 'ibeam' or 'tube'
+TWIST = 0.0                                             # Cross-section roll over ARC_SPAN (radians); math.pi for a Mobius ring
+LOD_SUBDIVISIONS = (1, 2, 4, 8, 16)                     # Level-of-detail chain, coarsest first, each level dividing the next
+LOD_PIXELS = 24                                         # Target projected arc length per subdivision; None for fixed detail
 LIGHTS_PER_SEGMENT = 200
+RNG_SEED = None                                         # None for a fresh city layout every launch
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.scene_cache') # Seeded scenes only; None disables
+
+# Streaming (rings too big to generate up front)
+STREAM_SEGMENTS = None                                  # Ring size to stream on demand (e.g. 2_000_000); None builds N_SEGMENTS up front
+STREAM_BUDGET, STREAM_CACHE = 128, 1024                 # Most segments (or proxies) drawn per frame; LRU capacity in segments of lights
+STREAM_PREFETCH = 32                                    # Segments generated ahead beyond each end of a visible run
 
 # Camera / View
-SCALE, TILT = 52.5, math.radians(38)                    # Orthographic projection (no perspective)
+SCALE, TILT = 52.5, math.radians(38)                    # Pixels per unit (orthographic, or perspective at the ring centre)
+PROJECTION = 'orthographic'                             # 'orthographic' or 'perspective'
+FOV, NEAR_PLANE = math.radians(60), 0.25                # Perspective: vertical field of view; near clip distance from the eye
+CAMERA_DISTANCE = HEIGHT * 0.5 / math.tan(FOV * 0.5) / SCALE # Perspective eye to ring centre, framing the ring like SCALE
 INITIAL_YAW, BASE_AZIM = math.radians(42), math.radians(45)
 ROT_SPEED = 35 * math.pi / 600.0
+ZOOM_STEP, ZOOM_RANGE = 1.25, (0.25, 1e7)               # Mouse wheel zoom factor per notch; limits
 
 EDGE_WIDTH, STAR_RADIUS, STAR_GLOW_RADIUS = 1, 8, 30
 BG_STAR_COUNT = 600
+BG_MODE = 'cached'                                      # 'cached' (32-bit star layer) or 'palette' (8-bit, twinkle = palette)
+STAR_HUES, STAR_TWINKLE_GROUPS = 17, 15                 # Palette star layer: 1 + 17 * 15 = 256 slots
 
 # Face rendering
 FACE_EDGE_FRONT = (0, 255, 0)
@@ -47,20 +67,116 @@ FACE_EDGE_BACK = (0, 200, 255)
 FACE_FILL_FRONT = (0, 255, 0, 80)
 FACE_FILL_BACK = (0, 200, 255, 45)
 DOUBLE_FACE_Z_OFFSET = 1e-4
+FACE_HOVER = (255, 255, 255)                            # Outline of the face and city light under the mouse cursor
+LIGHT_PICK_PIXELS = 8                                   # Hover selects the nearest city light within this many pixels
+FACE_SIDES = 'merged'                                   # 'merged' (each face once, back fill pre-composited under front), 'facing' (each
+                                                        # face once, in the style of the side it shows) or 'both' (layered)
+FILL_MODE = 'blend'                                     # 'surface', 'blend' (direct alpha fill), 'coverage' or 'numpy'
+DEPTH_SORT = 'analytic'                                 # 'argsort' (centroid depths) or 'analytic' (ring layout, orthographic only)
+
+STAR_DTYPE = np.dtype([('x', np.int32), ('y', np.int32), ('size', np.float32), ('brightness', np.uint8),
+                       ('color', np.uint8, 3), ('slot', np.uint8)])
+
+def hsv_to_rgb(hue: np.ndarray) -> np.ndarray:
+    """Fully saturated, full-value HSV to RGB in [0, 1] for an array of hues (colorsys.hsv_to_rgb, vectorized)."""
+    h6 = np.asarray(hue, dtype=float) * 6.0
+    i = np.floor(h6).astype(np.int64) % 6
+    f = h6 - np.floor(h6)
+    one, zero, q = np.ones_like(f), np.zeros_like(f), 1.0 - f
+    table = np.stack([np.stack(c, axis=-1) for c in ((one, f, zero), (q, one, zero), (zero, one, f),
+                                                     (zero, q, one), (f, zero, one), (one, zero, q))])
+    return np.take_along_axis(table, i[None, ..., None], axis=0)[0]
 
-def generate_bg_stars(width: int, height: int, count: int) -> List[List[float]]:
-    """Generate random background stars."""
-    stars = []
-    for _ in range(count):
-        hue = random.random()
-        rgb = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
-        stars.append([
-            random.randint(0, width), random.randint(0, height),    # x, y
-            random.uniform(0.5, 2.0), random.randint(100, 255),     # size, brightness
-            (int(rgb[0]*255), int(rgb[1]*255), int(rgb[2]*255))     # color
-        ])
+def generate_bg_stars(width: int, height: int, count: int, rng: Optional[np.random.Generator] = None,
+                      indexed: bool = False) -> np.ndarray:
+    """Generate random background stars as a STAR_DTYPE structured array. With indexed=True each star's colour
+    snaps to its hue bucket and its slot is 1 + hue bucket * STAR_TWINKLE_GROUPS + twinkle group (else slot 0)."""
+    rng = rng if rng is not None else np.random.default_rng()
+    stars = np.empty(count, dtype=STAR_DTYPE)
+    hue = rng.random(count)
+    if indexed: hue = np.floor(hue * STAR_HUES) / STAR_HUES
+    stars['x'], stars['y'] = rng.integers(0, width, count, endpoint=True), rng.integers(0, height, count, endpoint=True)
+    stars['size'], stars['brightness'] = rng.uniform(0.5, 2.0, count), rng.integers(100, 255, count, endpoint=True)
+    stars['color'] = (hsv_to_rgb(hue) * 255).astype(np.uint8) # Truncate like int(rgb * 255)
+    stars['slot'] = 1 + np.rint(hue * STAR_HUES).astype(np.int64) * STAR_TWINKLE_GROUPS + rng.integers(0, STAR_TWINKLE_GROUPS, count) if indexed else 0
     return stars
 
+class BackgroundLayer:
+    """Cached starfield and central star glow. Stars are drawn once into a cached surface and twinkling only
+    redraws the stars that changed. The glow rings are pre-rendered once as a multiply layer and an add layer,
+    which reproduces stacking the translucent rings over whatever lies underneath. Twinkling draws from `rng`."""
+    def __init__(self, size: Tuple[int, int], stars: np.ndarray, rng: Optional[np.random.Generator] = None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.stars, self.surface = stars, self.make_surface(size)
+        self.draw_stars(np.arange(len(stars)))
+        r_max = STAR_GLOW_RADIUS
+        rings = np.zeros((2 * r_max, 2 * r_max), dtype=np.int32)
+        for r in range(r_max, 0, -5): # Count the 15-alpha white rings covering each pixel
+            ring = pygame.Surface((2 * r_max, 2 * r_max))
+            pygame.draw.circle(ring, (255, 255, 255), (r_max, r_max), r)
+            rings += pygame.surfarray.array2d(ring) != 0
+        keep = (1.0 - 15 / 255.0) ** rings
+        self.glow_mul = pygame.surfarray.make_surface(np.repeat(np.round(keep * 255).astype(np.uint8)[..., None], 3, axis=2))
+        self.glow_add = pygame.surfarray.make_surface(np.repeat(np.round((1.0 - keep) * 255).astype(np.uint8)[..., None], 3, axis=2))
+
+    def make_surface(self, size: Tuple[int, int]) -> pygame.Surface:
+        surface = pygame.Surface(size)
+        surface.fill(BACKGROUND)
+        return surface
+
+    def star_colors(self, stars: np.ndarray) -> np.ndarray:
+        return (stars['color'] * (stars['brightness'][:, None] / 255.0)).astype(np.int64)
+
+    def draw_stars(self, indices: np.ndarray) -> None:
+        """Draw the given stars; the columns are converted to Python values once per call, not per star."""
+        stars = self.stars[indices]
+        circle, surface = pygame.draw.circle, self.surface
+        for x, y, size, color in zip(stars['x'].tolist(), stars['y'].tolist(), stars['size'].tolist(), self.star_colors(stars).tolist()):
+            circle(surface, color, (x, y), size)
+
+    def twinkle(self, rate: float = 0.02) -> None:
+        """Give a random `rate` fraction of stars a new brightness and redraw just those."""
+        changed = np.flatnonzero(self.rng.random(len(self.stars)) < rate)
+        self.stars['brightness'][changed] = self.rng.integers(100, 256, len(changed)) # Same size and position, so the redraw covers the old pixels
+        self.draw_stars(changed)
+
+    def draw(self, screen: pygame.Surface) -> None:
+        screen.blit(self.surface, (0, 0))
+
+    def draw_glow(self, screen: pygame.Surface, center: Tuple[int, int]) -> None:
+        corner = (center[0] - STAR_GLOW_RADIUS, center[1] - STAR_GLOW_RADIUS)
+        screen.blit(self.glow_mul, corner, special_flags=pygame.BLEND_RGB_MULT)
+        screen.blit(self.glow_add, corner, special_flags=pygame.BLEND_RGB_ADD)
+        pygame.draw.circle(screen, (255, 255, 255), center, STAR_RADIUS)
+
+class IndexedBackgroundLayer(BackgroundLayer):
+    """Background layer whose stars live in an 8-bit surface and reference palette slots (see generate_bg_stars).
+    Every star of a slot shares its brightness, so twinkling rewrites a few of the 256 palette entries and costs
+    the same for any number of stars; the layer is blitted once per frame."""
+    def __init__(self, size: Tuple[int, int], stars: np.ndarray, rng: Optional[np.random.Generator] = None):
+        rng = rng if rng is not None else np.random.default_rng()
+        self.hues = hsv_to_rgb(np.arange(STAR_HUES) / STAR_HUES).tolist()
+        self.brightness = rng.integers(100, 256, STAR_HUES * STAR_TWINKLE_GROUPS)
+        super().__init__(size, stars, rng)
+
+    def make_surface(self, size: Tuple[int, int]) -> pygame.Surface:
+        surface = pygame.Surface(size, depth=8)
+        surface.set_palette([BACKGROUND] + [self.slot_color(i) for i in range(len(self.brightness))])
+        return surface
+
+    def slot_color(self, i: int) -> Tuple[int, int, int]:
+        rgb, b = self.hues[i // STAR_TWINKLE_GROUPS], self.brightness[i] / 255.0
+        return (int(rgb[0] * 255 * b), int(rgb[1] * 255 * b), int(rgb[2] * 255 * b))
+
+    def star_colors(self, stars: np.ndarray) -> np.ndarray:
+        return stars['slot'].astype(np.int64) # Colour index = palette slot
+
+    def twinkle(self, rate: float = 0.02) -> None:
+        """Give a random `rate` fraction of palette slots a new brightness."""
+        changed = np.flatnonzero(self.rng.random(len(self.brightness)) < rate)
+        self.brightness[changed] = self.rng.integers(100, 256, len(changed))
+        for i in changed.tolist(): self.surface.set_palette_at(1 + i, self.slot_color(i))
+
 def rotation_matrix_z(theta: float) -> np.ndarray:
     c, s = math.cos(theta), math.sin(theta)
     return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]], dtype=float)
@@ -73,55 +189,91 @@ def rotation_matrix_y(theta: float) -> np.ndarray:
     c, s = math.cos(theta), math.sin(theta)
     return np.array([[c, 0.0, s], [0.0, 1.0, 0.0], [-s, 0.0, c]], dtype=float)
 
-def make_curved_beveled_segment(angle_center: float, angle_span: float, r_inner: float, r_outer: float, height: float, subdivs: int = 4, bevel: float = 0.1) -> Tuple[np.ndarray, List[Tuple[int, int]], List[Tuple[List[int], List[bool]]]]:
-    """Generate a curved segment (simple box cross-section). Returns: vertices, edges, faces (indices, edge_flags)"""
+class SegmentMesh(NamedTuple):
+    """Precompiled segment topology: quads index into verts; edges are the deduplicated flagged quad edges.
+    Corner k of face f draws edge face_edges[f, k] (-1: not drawn) from faces[f, k] to faces[f, (k + 1) % 4];
+    edge_flipped[f, k] is set when that direction is the reverse of the stored (low, high) edge."""
+    verts: np.ndarray           # (V, 3) float
+    faces: np.ndarray           # (F, 4) int32
+    flags: np.ndarray           # (F, 4) bool, edge k runs from corner k to corner k + 1
+    edges: np.ndarray           # (E, 2) int32
+    face_edges: np.ndarray      # (F, 4) int32
+    edge_flipped: np.ndarray    # (F, 4) bool
+
+def compile_edges(faces: np.ndarray, flags: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Deduplicate the flagged edges of (F, 4) quads. Returns: edges (E, 2), face_edges (F, 4), edge_flipped (F, 4)"""
+    a, b = faces, np.roll(faces, -1, axis=1)
+    n = int(faces.max()) + 1 if faces.size else 1
+    keys, inverse = np.unique((np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b))[flags], return_inverse=True) # (low, high) as one int
+    face_edges = np.full(faces.shape, -1, dtype=np.int32)
+    face_edges[flags] = inverse.ravel()
+    return np.stack([keys // n, keys % n], axis=1).astype(np.int32), face_edges, a > b
+
+class Profile(NamedTuple):
+    """Closed cross-section in (radius, z), listed counter-clockwise, with its cap split into quads."""
+    points: np.ndarray          # (P, 2)
+    caps: np.ndarray            # (C, 4) int, quads over points; a repeated index makes a triangle
+    creases: np.ndarray         # (P,) bool, draw the edge this point sweeps along the arc
+
+def strip_caps(n_points: int) -> np.ndarray:
+    """Split a convex n-gon into quads by pairing point k with point n - 1 - k (odd n ends in a triangle)."""
+    k = np.arange((n_points - 1) // 2)
+    return np.stack([k, k + 1, np.maximum(n_points - 2 - k, k + 1), n_points - 1 - k], axis=1)
+
+def box_profile(r_inner: float, r_outer: float, height: float, bevel: float = 0.0) -> Profile:
+    """Rectangle with its corners cut by `bevel` (world units); bevel <= 0 keeps the plain 4-point box."""
+    h, b = height / 2, min(bevel, (r_outer - r_inner) / 2, height / 2)
+    if b <= 0: points = [(r_inner, -h), (r_outer, -h), (r_outer, h), (r_inner, h)]
+    else: points = [(r_inner + b, -h), (r_outer - b, -h), (r_outer, -h + b), (r_outer, h - b), (r_outer - b, h), (r_inner + b, h), (r_inner, h - b), (r_inner, -h + b)]
+    return Profile(np.array(points, dtype=float), strip_caps(len(points)), np.ones(len(points), dtype=bool))
+
+def ibeam_profile(r_inner: float, r_outer: float, height: float, flange: float = 0.2, web: float = 0.2) -> Profile:
+    """I-beam: flanges of `flange` * height at top and bottom joined by a web `web` * width thick."""
+    h, f, rm, w = height / 2, flange * height, (r_inner + r_outer) / 2, web * (r_outer - r_inner) / 2
+    points = [(r_inner, -h), (r_outer, -h), (r_outer, -h + f), (rm + w, -h + f), (rm + w, h - f), (r_outer, h - f),
+              (r_outer, h), (r_inner, h), (r_inner, h - f), (rm - w, h - f), (rm - w, -h + f), (r_inner, -h + f)]
+    caps = [[0, 1, 2, 3], [0, 3, 10, 11], [10, 3, 4, 9], [4, 5, 6, 7], [4, 7, 8, 9]] # Flange, flange, web, flange, flange
+    return Profile(np.array(points, dtype=float), np.array(caps), np.ones(len(points), dtype=bool))
+
+def tube_profile(r_inner: float, r_outer: float, height: float, sides: int = 16) -> Profile:
+    """Ellipse filling the box; only the four extreme points crease."""
+    t = np.linspace(0.0, 2 * np.pi, sides, endpoint=False)
+    points = np.stack([(r_inner + r_outer) / 2 + (r_outer - r_inner) / 2 * np.cos(t), height / 2 * np.sin(t)], axis=1)
+    return Profile(points, strip_caps(sides), np.arange(sides) % max(1, sides // 4) == 0)
+
+PROFILES = {'box': box_profile, 'ibeam': lambda ri, ro, h, bevel: ibeam_profile(ri, ro, h), 'tube': lambda ri, ro, h, bevel: tube_profile(ri, ro, h)}
+
+def outline_flags(quads: np.ndarray, n_points: int) -> np.ndarray:
+    """Edge k of each quad is drawn when it joins two neighbouring profile points (an outline edge)."""
+    a, b = quads, np.roll(quads, -1, axis=1)
+    return (a != b) & (((b - a) % n_points == 1) | ((a - b) % n_points == 1))
+
+def sweep_profile(profile: Profile, angle_center: float, angle_span: float, subdivs: int) -> SegmentMesh:
+    """Sweep a cross-section along an arc about Z. Side faces are numbered ring by ring (face (i - 1) * P + j
+    joins profile points j and j + 1 between rings i - 1 and i), followed by the start and end caps."""
     half_span = angle_span * 0.5
-    rs, zs = [r_inner, r_outer, r_outer, r_inner], [-height/2, -height/2, height/2, height/2]
     theta_steps = np.linspace(angle_center - half_span, angle_center + half_span, subdivs + 1)
-    verts, faces_with_flags = [], []
-    n_rings, points_per_ring = len(theta_steps), 4
-    
-    for i, theta in enumerate(theta_steps):
-        c, s = math.cos(theta), math.sin(theta)
-        for j in range(points_per_ring): verts.append([rs[j] * c, rs[j] * s, zs[j]])
-        
-        if i > 0:
-            base, prev_base = i * points_per_ring, (i - 1) * points_per_ring
-            for j in range(points_per_ring):
-                next_j = (j + 1) % points_per_ring
-                draw_flags = [True, i == n_rings - 1, True, i == 1] # Long, Ring i, Long, Ring i-1
-                faces_with_flags.append(([prev_base + j, base + j, base + next_j, prev_base + next_j], draw_flags))
-
-    # End caps: Start cap (i=0) and End cap (i=n_rings-1)
-    faces_with_flags.append(([0, 1, 2, 3], [True]*4))
-    last_base = (n_rings - 1) * points_per_ring
-    faces_with_flags.append(([last_base+3, last_base+2, last_base+1, last_base], [True]*4))
-    return np.array(verts, dtype=float), [], faces_with_flags
-
-def sample_point_on_quad(verts: np.ndarray, face: List[int]) -> np.ndarray:
-    """Sample a random point on a quad face."""
-    if len(face) != 4: return verts[face[0]]
-    a, b, c, d = (verts[idx] for idx in face)
-    u, v = np.random.rand(2)
-    return (1-u)*(1-v)*a + u*(1-v)*b + u*v*c + (1-u)*v*d
-
-def generate_lights_for_face(verts: np.ndarray, face_indices: List[int], count: int) -> List[Tuple[np.ndarray, float, Tuple[int, int, int]]]:
-    """Generate random lights on a single face."""
-    lights = []
-    for _ in range(count):
-        pt = sample_point_on_quad(verts, face_indices)
-        size = random.uniform(3.0, 8.0) if random.random() < 0.1 else random.uniform(0.15, 2.5)
-        lights.append((pt, size, (random.randint(100, 200), random.randint(0, 30), random.randint(0, 30))))
-    return lights
-
-def reverse_edge_flags(edge_flags: List[bool]) -> List[bool]:
-    """Re-map edge draw flags for a polygon whose winding has been reversed."""
-    if len(edge_flags) <= 1: return list(edge_flags)
-    return list(reversed(edge_flags[:-1])) + [edge_flags[-1]]
-
-def draw_translucent_polygon(surface: pygame.Surface, points: List[Tuple[float, float]], color: Tuple[int, int, int, int]) -> None:
-    """Draw a translucent polygon by rasterizing to a temporary alpha surface."""
-    if len(points) < 3: return
+    (rs, zs), n_rings, points_per_ring = profile.points.T, subdivs + 1, len(profile.points)
+    verts = np.stack([rs * np.cos(theta_steps)[:, None], rs * np.sin(theta_steps)[:, None], np.broadcast_to(zs, (n_rings, points_per_ring))], axis=-1).reshape(-1, 3)
+
+    i, j = np.meshgrid(np.arange(1, n_rings), np.arange(points_per_ring), indexing='ij') # Ring i, profile point j
+    base, prev_base, next_j = i * points_per_ring, (i - 1) * points_per_ring, (j + 1) % points_per_ring
+    sides = np.stack([prev_base + j, base + j, base + next_j, prev_base + next_j], axis=-1).reshape(-1, 4)
+    side_flags = np.stack([profile.creases[j], i == n_rings - 1, profile.creases[next_j], i == 1], axis=-1).reshape(-1, 4) # Long, Ring i, Long, Ring i-1
+
+    # End caps: Start cap (i=0) and End cap (i=n_rings-1), wound the other way
+    end_caps = profile.caps[:, ::-1] + (n_rings - 1) * points_per_ring
+    faces = np.concatenate([sides, profile.caps, end_caps]).astype(np.int32)
+    flags = np.concatenate([side_flags, outline_flags(profile.caps, points_per_ring), outline_flags(profile.caps[:, ::-1], points_per_ring)])
+    return SegmentMesh(verts, faces, flags, *compile_edges(faces, flags))
+
+def make_curved_beveled_segment(angle_center: float, angle_span: float, r_inner: float, r_outer: float, height: float, subdivs: int = 4, bevel: float = 0.1) -> SegmentMesh:
+    """Generate a curved segment with a box cross-section beveled by `bevel` (see sweep_profile)."""
+    return sweep_profile(box_profile(r_inner, r_outer, height, bevel), angle_center, angle_span, subdivs)
+
+def draw_translucent_polygon(surface: pygame.Surface, points: List[Tuple[float, float]], color: Tuple[int, int, int, int]) -> int:
+    """Draw a translucent polygon by rasterizing to a temporary alpha surface. Returns the Surfaces allocated."""
+    if len(points) < 3: return 0
     xs, ys = [p[0] for p in points], [p[1] for p in points]
     min_x, max_x = min(xs), max(xs)
     min_y, max_y = min(ys), max(ys)
@@ -133,13 +285,964 @@ def draw_translucent_polygon(surface: pygame.Surface, points: List[Tuple[float,
     offset_points = [(x - offset_x, y - offset_y) for x, y in points]
     pygame.draw.polygon(poly_surface, color, offset_points)
     surface.blit(poly_surface, (offset_x, offset_y))
+    return 1
+
+class SurfaceFiller:
+    """draw_translucent_polygon with allocations, polygons and fill_time tracked per instance, to compare with
+    TranslucentFiller."""
+    def __init__(self):
+        self.allocations, self.polygons, self.fill_time = 0, 0, 0.0
+
+    def fill(self, surface: pygame.Surface, points: List[Tuple[float, float]], color: Tuple[int, int, int, int]) -> None:
+        start = time.perf_counter()
+        allocated = draw_translucent_polygon(surface, points, color)
+        self.allocations, self.polygons = self.allocations + allocated, self.polygons + allocated
+        self.fill_time += time.perf_counter() - start
+
+class TranslucentFiller:
+    """Blends translucent polygons straight into the target with SDL_gfx's alpha span fill.
+    No scratch Surface is allocated or blitted per face; polygons and fill_time are tracked per instance."""
+    def __init__(self):
+        self.polygons, self.fill_time = 0, 0.0
+
+    def fill(self, surface: pygame.Surface, points: List[Tuple[float, float]], color: Tuple[int, int, int, int]) -> None:
+        if len(points) < 3: return
+        start = time.perf_counter()
+        pygame.gfxdraw.filled_polygon(surface, points, color)
+        self.polygons += 1
+        self.fill_time += time.perf_counter() - start
+
+def polygon_crossings(polys: np.ndarray, width: int, height: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Scanline edge crossings of polygons (K, P, 2), sampled at pixel centres and clipped to the viewport.
+    Returns: row, column, winding, polygon index. Windings are oriented so that a prefix sum of the crossings
+    along a row is +1 inside each (convex) polygon, whichever way round it is wound."""
+    polys = np.asarray(polys, dtype=np.float64).reshape(len(polys), -1, 2)
+    nxt = np.roll(polys, -1, axis=1)
+    area = np.sum(polys[:, :, 0] * nxt[:, :, 1] - nxt[:, :, 0] * polys[:, :, 1], axis=1)
+    px, py, qx, qy = polys[:, :, 0].ravel(), polys[:, :, 1].ravel(), nxt[:, :, 0].ravel(), nxt[:, :, 1].ravel()
+    down = qy > py
+    winding = np.where(down, -1, 1) * np.repeat(np.sign(area), polys.shape[1]).astype(np.int64)
+    y0, y1 = np.minimum(py, qy), np.maximum(py, qy)
+    x_top = np.where(down, px, qx)
+    slope = (qx - px) / np.where(qy != py, qy - py, 1.0)
+    r0 = np.clip(np.ceil(y0 - 0.5), 0, height).astype(np.int64) # Rows whose centre lies in [y0, y1)
+    r1 = np.clip(np.ceil(y1 - 0.5), 0, height).astype(np.int64)
+    counts = np.maximum(r1 - r0, 0)
+    edge = np.repeat(np.arange(len(px)), counts)
+    row = r0[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+    x = x_top[edge] + (row + 0.5 - y0[edge]) * slope[edge]
+    col = np.clip(np.ceil(x - 0.5), 0, width).astype(np.int64)
+    return row, col, winding[edge], edge // polys.shape[1]
+
+class CoverageCompositor:
+    """Order-independent fill compositing for uniformly coloured front and back layers.
+    Stacking n layers of one RGBA colour depends only on n, so faces are reduced to per-pixel layer counts
+    (scanline edge crossings + bincount) and resolved as out = bg * keep[code] + rgb[code]. The lookup is done
+    by two 8-bit surfaces whose palettes hold keep and rgb, blitted with BLEND_RGB_MULT and BLEND_RGB_ADD."""
+    MAX_LAYERS = 15 # Counts saturate here; 15 stacked layers leave < 0.1% of the background
+
+    def __init__(self, front: Tuple[int, int, int, int] = FACE_FILL_FRONT, back: Tuple[int, int, int, int] = FACE_FILL_BACK):
+        self.polygons, self.fill_time, self.layers = 0, 0.0, None
+        n_front, n_back = np.divmod(np.arange((self.MAX_LAYERS + 1) ** 2), self.MAX_LAYERS + 1)
+        self.keep, self.rgb = self.resolve(n_front, n_back, front, back)
+        keep = np.round(self.keep * 255).astype(int).tolist()
+        self.palettes = ([(k, k, k) for k in keep], [tuple(c) for c in np.round(self.rgb).astype(int).tolist()])
+
+    @staticmethod
+    def resolve(n_front: np.ndarray, n_back: np.ndarray, front: Tuple[int, int, int, int], back: Tuple[int, int, int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Closed form of n_back back layers and n_front front layers over a background: out = bg * keep + rgb.
+        A face drawn in both styles contributes a (back, front) pair, so pairs are exact; unpaired back
+        layers go underneath and unpaired front layers on top."""
+        a_back, a_front = back[3] / 255.0, front[3] / 255.0
+        c_back, c_front = np.asarray(back[:3], dtype=float), np.asarray(front[:3], dtype=float)
+        pairs = np.minimum(n_front, n_back)
+        keep, rgb = (1.0 - a_back) ** (n_back - pairs), np.zeros((len(pairs), 3))
+        rgb = rgb + c_back * (1.0 - keep)[:, None]
+        k_pair = (1.0 - a_back) * (1.0 - a_front)
+        k_n = k_pair ** pairs
+        rgb = rgb * k_n[:, None] + (c_back * a_back * (1.0 - a_front) + c_front * a_front) * ((1.0 - k_n) / (1.0 - k_pair))[:, None]
+        keep = keep * k_n
+        k_f = (1.0 - a_front) ** (n_front - pairs)
+        return keep * k_f, rgb * k_f[:, None] + c_front * (1.0 - k_f)[:, None]
+
+    @classmethod
+    def merged(cls, front: Tuple[int, int, int, int] = FACE_FILL_FRONT, back: Tuple[int, int, int, int] = FACE_FILL_BACK) -> Tuple[int, int, int, int]:
+        """One RGBA fill that looks like `back` then `front` blended over any background: alpha 1 - keep of the pair."""
+        keep, rgb = cls.resolve(np.ones(1), np.ones(1), front, back)
+        alpha = 1.0 - keep[0]
+        return (*np.round(rgb[0] / alpha).astype(int).tolist(), int(round(alpha * 255)))
+
+    @staticmethod
+    def coverage(polys: np.ndarray, width: int, height: int) -> np.ndarray:
+        """Per-pixel count of polygons covering each pixel, indexed [x, y] like pygame.surfarray."""
+        row, col, winding, _ = polygon_crossings(polys, width, height)
+        diff = np.bincount(col * height + row, weights=winding, minlength=(width + 1) * height).astype(np.int32)
+        return np.cumsum(diff.reshape(width + 1, height), axis=0)[:width]
+
+    def layer_codes(self, front: np.ndarray, back: np.ndarray, size: Tuple[int, int]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Top-left corner and [x, y] lookup codes (n_front * 16 + n_back) over the bounding box of all polygons."""
+        both = np.concatenate([front, back]).reshape(-1, 2)
+        if not len(both): return np.zeros(2, dtype=int), None
+        lo = np.clip(np.floor(both.min(axis=0)).astype(int), 0, size)
+        hi = np.clip(np.ceil(both.max(axis=0)).astype(int) + 1, 0, size)
+        width, height = hi - lo
+        if width <= 0 or height <= 0: return lo, None
+        n_front = np.minimum(self.coverage(front - lo, width, height), self.MAX_LAYERS)
+        n_back = n_front if back is front else np.minimum(self.coverage(back - lo, width, height), self.MAX_LAYERS)
+        return lo, (n_front * (self.MAX_LAYERS + 1) + n_back).astype(np.uint8)
+
+    def composite(self, surface: pygame.Surface, front: np.ndarray, back: np.ndarray) -> None:
+        """Blend front-style and back-style polygon layers (K, P, 2) into surface."""
+        start = time.perf_counter()
+        if self.layers is None or self.layers[0].get_size() != surface.get_size():
+            self.layers = tuple(pygame.Surface(surface.get_size(), depth=8) for _ in self.palettes)
+            for layer, palette in zip(self.layers, self.palettes): layer.set_palette(palette)
+        lo, code = self.layer_codes(front, back, surface.get_size())
+        if code is not None:
+            for layer, flags in zip(self.layers, (pygame.BLEND_RGB_MULT, pygame.BLEND_RGB_ADD)):
+                pixels = pygame.surfarray.pixels2d(layer)
+                pixels[:code.shape[0], :code.shape[1]] = code
+                del pixels
+                surface.blit(layer, lo.tolist(), (0, 0) + code.shape, special_flags=flags)
+        self.polygons += len(front) + len(back)
+        self.fill_time += time.perf_counter() - start
+
+class NumpyRasterizer(CoverageCompositor):
+    """Pure-NumPy fill backend: the same scanline coverage, blended straight into pygame.surfarray.pixels3d
+    (and pixels_alpha for per-pixel-alpha targets) with no pygame.draw calls or blits. Each composite call
+    rasterizes one batch, typically every face of a segment, with segments drawn back to front."""
+    def __init__(self, front: Tuple[int, int, int, int] = FACE_FILL_FRONT, back: Tuple[int, int, int, int] = FACE_FILL_BACK):
+        super().__init__(front, back)
+        self.mul = np.round(self.keep * 256).astype(np.uint16)
+        self.add = np.round(self.rgb * 256).astype(np.uint16) + 128 # Pre-scaled by 256, +0.5 for rounding
+
+    def composite(self, surface: pygame.Surface, front: np.ndarray, back: np.ndarray) -> None:
+        start = time.perf_counter()
+        lo, code = self.layer_codes(front, back, surface.get_size())
+        if code is not None:
+            hi = lo + code.shape
+            pixels = pygame.surfarray.pixels3d(surface)
+            region = pixels[lo[0]:hi[0], lo[1]:hi[1]]
+            region[...] = (region * self.mul[code][..., None] + self.add[code]) >> 8
+            del region, pixels
+            if surface.get_flags() & pygame.SRCALPHA: # Coverage of a layer stack: 1 - keep
+                alpha = pygame.surfarray.pixels_alpha(surface)
+                region = alpha[lo[0]:hi[0], lo[1]:hi[1]]
+                region[...] = 255 - (((255 - region) * self.mul[code] + 128) >> 8)
+                del region, alpha
+        self.polygons += len(front) + len(back)
+        self.fill_time += time.perf_counter() - start
+
+@functools.lru_cache(maxsize=None)
+def disk_offsets(radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Pixel offsets that pygame.draw.circle fills for a circle of `radius` centred on (0, 0)."""
+    stamp = pygame.Surface((2 * radius + 3, 2 * radius + 3))
+    pygame.draw.circle(stamp, (255, 255, 255), (radius + 1, radius + 1), radius)
+    xs, ys = np.nonzero(pygame.surfarray.array2d(stamp))
+    return xs - radius - 1, ys - radius - 1
+
+def map_colors(surface: pygame.Surface, colors: np.ndarray) -> np.ndarray:
+    """Vectorized Surface.map_rgb for (N, 3) uint8 colours, opaque on per-pixel-alpha surfaces."""
+    shifts, losses = surface.get_shifts(), surface.get_losses()
+    mapped = np.full(len(colors), surface.get_masks()[3], dtype=np.int64)
+    for c in range(3): mapped |= (colors[:, c].astype(np.int64) >> losses[c]) << shifts[c]
+    return mapped.astype(np.uint32)
+
+class LightSplatter:
+    """Stamps city lights into the frame in bulk instead of one pygame.draw.circle per light.
+    Lights are bucketed by integer radius once; each frame every bucket is one scatter of its precomputed
+    disk offsets into the frame's pixel buffer, with per-pixel clipping only for stamps crossing the border."""
+    MAX_RADIUS = 64                                     # Perspective cap for lights right in front of the eye
+
+    def __init__(self, surface: pygame.Surface, sizes: np.ndarray, colors: np.ndarray):
+        self.sizes, self.mapped = sizes, map_colors(surface, colors)
+        self.order, self.radii, self.bounds = self.buckets(np.maximum(1, sizes.astype(int)))
+        self.colors = self.mapped[self.order]
+
+    @staticmethod
+    def buckets(radius: np.ndarray) -> Tuple[np.ndarray, List[int], List[int]]:
+        """Light order by radius (small lights first so big ones land on top), the distinct radii and their bounds."""
+        order = np.argsort(radius, kind='stable')
+        radii, starts = np.unique(radius[order], return_index=True)
+        return order, radii.tolist(), np.append(starts, len(radius)).tolist()
+
+    def splat(self, surface: pygame.Surface, x: np.ndarray, y: np.ndarray, visible: np.ndarray,
+              scale: Optional[np.ndarray] = None) -> None:
+        """Draw lights at screen positions (x, y) where visible; all arrays are in light store order.
+        A perspective `scale` multiplies every light's size, re-bucketing the lights for this frame."""
+        width, height = surface.get_size()
+        if scale is None: order, radii, bounds, colors = self.order, self.radii, self.bounds, self.colors
+        else:
+            order, radii, bounds = self.buckets(np.clip((self.sizes * scale).astype(int), 1, self.MAX_RADIUS))
+            colors = self.mapped[order]
+        reach = self.MAX_RADIUS + 1 # Anything further off screen draws nothing; clipping keeps huge zooms inside int32
+        xs, ys = np.clip(x[order], -reach, width + reach).astype(np.int32), np.clip(y[order], -reach, height + reach).astype(np.int32)
+        keep = visible[order]
+        pixels = pygame.surfarray.pixels2d(surface)
+        flat = pixels.T.reshape(-1) if pixels.T.flags['C_CONTIGUOUS'] else None # Rows of width pixels
+        for radius, start, end in zip(radii, bounds[:-1], bounds[1:]):
+            (dx, dy), lx, ly, color = disk_offsets(radius), xs[start:end], ys[start:end], colors[start:end]
+            inner = keep[start:end] & (lx >= radius) & (lx < width - radius) & (ly >= radius) & (ly < height - radius)
+            border = keep[start:end] & ~inner & (lx > -radius) & (lx < width + radius) & (ly > -radius) & (ly < height + radius)
+            if flat is not None:
+                offsets = (dy * width + dx).astype(np.int32)
+                flat[((ly[inner] * width + lx[inner])[:, None] + offsets).ravel()] = np.repeat(color[inner], len(offsets))
+            else:
+                border |= inner
+            px, py = (lx[border, None] + dx).ravel(), (ly[border, None] + dy).ravel()
+            inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+            pixels[px[inside], py[inside]] = np.repeat(color[border], len(dx))[inside]
+        del flat, pixels
+
+class LightGrid:
+    """Screen-space spatial hash of one frame's projected lights, for hover picking. Lights are binned into
+    CELL-pixel cells with one vectorized sort and indexed CSR-style like LightStore: cell c (row-major) holds
+    ids[start[c]:start[c + 1]]. A query reads only the cells it overlaps, one contiguous run per cell row,
+    so its cost follows the local light density and not the total light count."""
+    CELL = 16
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, visible: np.ndarray, size: Tuple[int, int], margin: float = 16.0, cell: int = CELL):
+        """Index the visible lights at (x, y) with centres inside the viewport of `size` grown by `margin` pixels,
+        which are clamped into the border cells."""
+        self.x, self.y, self.cell = x, y, cell
+        self.cols, self.rows = -(-size[0] // cell), -(-size[1] // cell)
+        ids = np.flatnonzero(visible & (x >= -margin) & (x < size[0] + margin) & (y >= -margin) & (y < size[1] + margin))
+        cells = self.row(y[ids]) * self.cols + self.col(x[ids])
+        if self.cols * self.rows <= 1 << 16: cells = cells.astype(np.uint16) # The stable sort is a radix sort for 16-bit keys
+        self.ids = ids[np.argsort(cells, kind='stable')]
+        self.start = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self.cols * self.rows))])
+
+    def col(self, x) -> np.ndarray:
+        return np.clip(np.asarray(x * (1.0 / self.cell)).astype(np.int32), 0, self.cols - 1) # Truncation only differs below 0
+
+    def row(self, y) -> np.ndarray:
+        return np.clip(np.asarray(y * (1.0 / self.cell)).astype(np.int32), 0, self.rows - 1)
+
+    def candidates(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Ids in every cell overlapping the rectangle [x0, x1] x [y0, y1]."""
+        c0, c1, r0, r1 = int(self.col(x0)), int(self.col(x1)), int(self.row(y0)), int(self.row(y1))
+        runs = [self.ids[self.start[r * self.cols + c0]:self.start[r * self.cols + c1 + 1]] for r in range(r0, r1 + 1)]
+        return np.concatenate(runs) if runs else self.ids[:0]
+
+    def nearest(self, x: float, y: float, reach: float) -> Optional[int]:
+        """The light centred nearest to (x, y), if any lies within `reach` pixels."""
+        ids = self.candidates(x - reach, y - reach, x + reach, y + reach)
+        if not len(ids): return None
+        d2 = (self.x[ids] - x) ** 2 + (self.y[ids] - y) ** 2
+        best = int(np.argmin(d2))
+        return int(ids[best]) if d2[best] <= reach * reach else None
+
+    def in_rect(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Lights centred inside the rectangle spanned by two corners, in cell order."""
+        x0, x1, y0, y1 = min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1)
+        ids = self.candidates(x0, y0, x1, y1)
+        return ids[(self.x[ids] >= x0) & (self.x[ids] <= x1) & (self.y[ids] >= y0) & (self.y[ids] <= y1)]
+
+def focal_length() -> float:
+    """Perspective focal length in pixels for the vertical FOV."""
+    return HEIGHT * 0.5 / math.tan(FOV * 0.5)
+
+def near_z() -> float:
+    """Camera-space z of the perspective near plane; points with a greater z are behind it."""
+    return CAMERA_DISTANCE - NEAR_PLANE
+
+def project_points(points: np.ndarray, margin: float = 0.0):
+    """Project camera-space 3D points to 2D screen space. PROJECTION 'orthographic' maps x, y directly;
+    'perspective' divides by the distance to an eye at z = CAMERA_DISTANCE looking down -z.
+    Returns: x, y, mask (in front of the near plane and inside the viewport grown by `margin` pixels),
+    scale (on-screen size relative to SCALE: 1 when orthographic, 0 behind the near plane)"""
+    if len(points) == 0: return np.array([]), np.array([]), np.array([], dtype=bool), np.array([])
+    if PROJECTION == 'perspective':
+        front = points[:, 2] <= near_z() # The test clip_near_plane clips to
+        scale = np.where(front, focal_length() / (SCALE * np.maximum(CAMERA_DISTANCE - points[:, 2], NEAR_PLANE)), 0.0)
+    else: front, scale = True, np.ones(len(points))
+    scaled = points[:, :2] * (SCALE * scale)[:, None]
+    x, y = WIDTH * 0.5 + scaled[:, 0], HEIGHT * 0.5 - scaled[:, 1]
+    mask = front & (x >= -margin) & (x < WIDTH + margin) & (y >= -margin) & (y < HEIGHT + margin)
+    return x, y, mask, scale
+
+def clip_near_plane(polygons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sutherland-Hodgman clip of camera-space convex polygons (K, P, 3) to the visible side of the near plane,
+    all polygons at once. Returns (K, P + 1, 3) polygons padded by repeating their last corner (a zero-length
+    edge that no rasterizer here draws) and each polygon's corner count (0: wholly behind the plane).
+    A two-corner polygon is a line segment: its first two output corners are the clipped segment."""
+    return clip_polygons(polygons, 2, near_z())
+
+def clip_polygons(polygons: np.ndarray, axis: int, limit: float, sign: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    """clip_near_plane's clip against any axis-aligned half-space, sign * polygons[..., axis] <= sign * limit."""
+    count, corners = polygons.shape[:2]
+    start, end = polygons, np.roll(polygons, -1, axis=1)
+    start_in, end_in = sign * start[..., axis] <= sign * limit, sign * end[..., axis] <= sign * limit
+    crosses = start_in != end_in
+    t = (limit - start[..., axis]) / np.where(crosses, end[..., axis] - start[..., axis], 1.0)
+    crossing = start + t[..., None] * (end - start)
+    crossing[..., axis] = limit # Exactly on the plane, so project_points keeps near-plane crossings
+    candidates = np.stack([start, crossing], axis=2).reshape(count, 2 * corners, polygons.shape[2])
+    keep = np.stack([start_in, crosses], axis=2).reshape(count, 2 * corners) # Each edge: its start if kept, its crossing
+    kept = keep.sum(axis=1)
+    first = np.argsort(~keep, axis=1, kind='stable')[:, :corners + 1] # Kept candidates first, in winding order
+    slot = np.minimum(np.arange(corners + 1), np.maximum(kept - 1, 0)[:, None])
+    return np.take_along_axis(candidates, np.take_along_axis(first, slot, axis=1)[..., None], axis=1), kept
+
+def clip_to_screen(polygons: np.ndarray, guard: float = 16.0) -> np.ndarray:
+    """Clip (K, P, 2) screen polygons reaching past the viewport grown by `guard` pixels to that band, padding
+    every polygon to (K, P + 4, 2) when any is clipped. SDL_gfx fills take 16-bit coordinates, and faces right in
+    front of the perspective eye (or at deep zoom) project far beyond them; the visible pixels do not change."""
+    lo, hi = np.array([-guard, -guard]), np.array([WIDTH + guard, HEIGHT + guard])
+    far = np.flatnonzero(((polygons < lo) | (polygons > hi)).any(axis=(1, 2)))
+    if not len(far): return polygons
+    clipped, inside = polygons[far], np.ones(len(far), dtype=bool)
+    for axis, limit, sign in ((0, lo[0], -1.0), (0, hi[0], 1.0), (1, lo[1], -1.0), (1, hi[1], 1.0)):
+        clipped, kept = clip_polygons(clipped, axis, limit, sign)
+        inside &= kept > 0
+    clipped[~inside] = lo # Wholly outside the band: an empty polygon off screen
+    padded = polygons[:, np.minimum(np.arange(polygons.shape[1] + 4), polygons.shape[1] - 1)]
+    padded[far] = clipped
+    return padded
+
+PAD_WINDING = np.array([0, 1, 2, 3, 3])                 # Quad as a clip_near_plane-shaped pentagon
+
+def project_faces(camera: np.ndarray, faces: np.ndarray, xy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Screen polygons of camera-space quads, given their vertices' projections `xy`, and which faces survive.
+    Orthographic: (F, 4, 2) and every face. Perspective: (F, 5, 2) (see clip_near_plane), where only quads crossing
+    the near plane are clipped and faces wholly behind it are dropped."""
+    if PROJECTION != 'perspective': return xy[faces], np.ones(len(faces), dtype=bool)
+    behind = (camera[:, 2] > near_z())[faces]
+    face_xy, kept = xy[faces[:, PAD_WINDING]], ~behind.all(axis=1)
+    crossing = np.flatnonzero(behind.any(axis=1) & kept)
+    if len(crossing):
+        x, y, _, _ = project_points(clip_near_plane(camera[faces[crossing]])[0].reshape(-1, 3))
+        face_xy[crossing] = np.stack([x, y], axis=1).reshape(len(crossing), -1, 2)
+    return face_xy, kept
+
+def project_edges(camera: np.ndarray, edges: np.ndarray, xy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(E, 2, 2) screen end points of camera-space edges and which survive, clipped like project_faces."""
+    if PROJECTION != 'perspective': return xy[edges], np.ones(len(edges), dtype=bool)
+    behind = (camera[:, 2] > near_z())[edges]
+    ends, kept = xy[edges], ~behind.all(axis=1)
+    crossing = np.flatnonzero(behind.any(axis=1) & kept)
+    if len(crossing):
+        x, y, _, _ = project_points(clip_near_plane(camera[edges[crossing]])[0][:, :2].reshape(-1, 3))
+        ends[crossing] = np.stack([x, y], axis=1).reshape(len(crossing), 2, 2)
+    return ends, kept
+
+def faces_on_screen(face_xy: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Per-face bounding-box test of (F, P, 2) screen polygons against the viewport. Vertex tests alone would drop
+    faces that cross the screen with every corner outside it."""
+    lo, hi = face_xy.min(axis=1), face_xy.max(axis=1)
+    return (hi[:, 0] >= 0) & (lo[:, 0] < width) & (hi[:, 1] >= 0) & (lo[:, 1] < height)
+
+def back_facing(face_xy: np.ndarray) -> np.ndarray:
+    """Which (F, P, 2) screen polygons show their back side: the sign of every face's shoelace area at once.
+    Front sides wind counter-clockwise on screen; projection keeps winding in front of the eye, so this is the
+    normal-dot-view test in perspective too. Edge-on faces count as front."""
+    x, y = face_xy[..., 0], face_xy[..., 1]
+    area = np.sum(x[:, :-1] * y[:, 1:] - x[:, 1:] * y[:, :-1], axis=1) + x[:, -1] * y[:, 0] - x[:, 0] * y[:, -1]
+    return area > 0 # y points down
+
+def side_layers(face_xy: np.ndarray, mask: np.ndarray, back: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Front-style and back-style compositor layers of the faces in `mask`: every face in both styles when `back`
+    is None (double-sided), otherwise each face in the style of the side it shows."""
+    if back is None:
+        xy = face_xy[mask]
+        return xy, xy
+    return face_xy[mask & ~back], face_xy[mask & back]
+
+class LightStore(NamedTuple):
+    """Array-backed city lights, CSR-indexed by ring face: face f owns rows face_offsets[f]:face_offsets[f + 1]."""
+    positions: np.ndarray       # (N, 3) float32, segment-local
+    sizes: np.ndarray           # (N,) float32
+    colors: np.ndarray          # (N, 3) uint8
+    face_offsets: np.ndarray    # (total_faces + 1,) int64
+    segment_faces: np.ndarray   # (n_segments + 1,) int64, first ring face of each segment
+    uv: np.ndarray              # (N, 2) float32, bilinear coordinates within the light's face
 
-def project_points(points: np.ndarray):
-    """Project 3D points to 2D screen space using Orthographic projection."""
-    if len(points) == 0: return np.array([]), np.array([]), np.array([]), np.array([])
-    scaled = points * SCALE
-    # Orthographic projection: No perspective divide, just map x, y directly to screen coordinates
-    return WIDTH * 0.5 + scaled[:, 0], HEIGHT * 0.5 - scaled[:, 1], np.ones_like(scaled[:, 0], dtype=bool), np.ones_like(scaled[:, 0])
+def generate_light_store(segments, count: int, rng: np.random.Generator) -> LightStore:
+    """Scatter `count` random city lights over each segment's faces, one batch of NumPy draws per segment.
+    Faces are picked in proportion to their area, so thin bevel strips get no more than their share."""
+    positions, sizes, colors, face_counts, uvs = [], [], [], [], []
+    for mesh in segments:
+        verts, quads = mesh.verts, mesh.faces
+        corners = np.asarray(verts, dtype=np.float64)[quads]
+        area = np.cumsum(0.5 * np.linalg.norm(np.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 1]), axis=1))
+        if len(quads) and count > 0 and area[-1] > 0: # Inverse CDF of the face areas
+            f_idx = np.minimum(np.sort(np.searchsorted(area, rng.random(count) * area[-1], side='right')), len(quads) - 1)
+        else: f_idx = np.zeros(0, dtype=np.int64)
+        a, b, c, d = np.asarray(verts, dtype=np.float32)[quads[f_idx]].transpose(1, 0, 2)
+        u, v = rng.random((2, len(f_idx), 1), dtype=np.float32)
+        positions.append((1-u)*(1-v)*a + u*(1-v)*b + u*v*c + (1-u)*v*d) # Bilinear point on each quad
+        uvs.append(np.concatenate([u, v], axis=1))
+        big = rng.random(len(f_idx)) < 0.1
+        sizes.append(np.where(big, rng.uniform(3.0, 8.0, len(f_idx)), rng.uniform(0.15, 2.5, len(f_idx))).astype(np.float32))
+        colors.append(np.stack([rng.integers(100, 201, len(f_idx)), rng.integers(0, 31, len(f_idx)), rng.integers(0, 31, len(f_idx))], axis=1).astype(np.uint8))
+        face_counts.append(np.bincount(f_idx, minlength=len(quads)))
+    face_offsets = np.concatenate(([0], np.cumsum(np.concatenate(face_counts), dtype=np.int64)))
+    segment_faces = np.concatenate(([0], np.cumsum([len(fc) for fc in face_counts], dtype=np.int64)))
+    return LightStore(np.concatenate(positions).reshape(-1, 3), np.concatenate(sizes), np.concatenate(colors).reshape(-1, 3), face_offsets, segment_faces,
+                      np.concatenate(uvs).reshape(-1, 2))
+
+def edge_draw_list(order: np.ndarray, face_edges: np.ndarray, edge_flipped: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Draw each edge once, at the last painter entry (see painter_depths) that draws it, with that entry's side
+    and direction. Returns: edge index, side (1: back) and flipped flag per drawn edge, in draw order."""
+    faces, sides = order >> 1, order & 1
+    drawn = face_edges[faces] >= 0
+    edge_ids = face_edges[faces][drawn]
+    _, last = np.unique(edge_ids[::-1], return_index=True) # Entries are in draw order, so keep each edge's last use
+    pick = np.sort(len(edge_ids) - 1 - last)
+    side = np.broadcast_to(sides[:, None], drawn.shape)[drawn][pick]
+    flipped = edge_flipped[faces][drawn][pick] ^ (side == 1) # The back side walks the quad in reverse
+    return edge_ids[pick], side, flipped
+
+class RingInstances(NamedTuple):
+    """One canonical segment placed N times: instance n is the mesh scaled by scale[n], rotated by angles[n]
+    about Z and moved by offset[n]. Vertex memory is O(segment); only the per-frame transform output is O(ring).
+    With a twist, every point is first rolled about the circle of radius twist_radius (the profile's centre line)
+    by twist * (its ring angle - twist_start), see roll_points."""
+    mesh: SegmentMesh
+    angles: np.ndarray          # (N,) rotation about Z
+    scale: np.ndarray           # (N,) uniform scale
+    offset: np.ndarray          # (N, 3) translation
+    twist: float = 0.0          # Cross-section roll per radian of ring angle
+    twist_radius: float = 0.0
+    twist_start: float = 0.0    # Ring angle of zero roll
+
+def make_ring_instances(mesh: SegmentMesh, angles, scale=None, offset=None, twist: float = 0.0, twist_radius: float = 0.0, twist_start: float = 0.0) -> RingInstances:
+    angles = np.asarray(angles, dtype=float)
+    scale = np.ones(len(angles)) if scale is None else np.broadcast_to(np.asarray(scale, dtype=float), angles.shape)
+    offset = np.zeros((len(angles), 3)) if offset is None else np.broadcast_to(np.asarray(offset, dtype=float), (len(angles), 3))
+    return RingInstances(mesh, angles, scale, offset, twist, twist_radius, twist_start)
+
+def roll_points(instances: RingInstances, points: np.ndarray, angle: np.ndarray) -> np.ndarray:
+    """Twist segment-local points of instances at ring angle `angle` (broadcast against points[..., 0]).
+    The roll is a rotation in each point's (radius, z) plane, so quad winding and orientation are preserved."""
+    theta = np.arctan2(points[..., 1], points[..., 0])
+    roll = instances.twist * (angle + theta - instances.twist_start)
+    c, s = np.cos(roll), np.sin(roll)
+    dr, z = np.hypot(points[..., 0], points[..., 1]) - instances.twist_radius, points[..., 2]
+    r = instances.twist_radius + dr * c - z * s
+    return np.stack([r * np.cos(theta), r * np.sin(theta), dr * s + z * c], axis=-1)
+
+def instance_matrices(instances: RingInstances) -> np.ndarray:
+    """(N, 3, 3) rotation * scale of every instance."""
+    c, s = np.cos(instances.angles), np.sin(instances.angles)
+    mats = np.zeros((len(c), 3, 3))
+    mats[:, 0, 0], mats[:, 0, 1], mats[:, 1, 0], mats[:, 1, 1], mats[:, 2, 2] = c, -s, s, c, 1.0
+    return mats * instances.scale[:, None, None]
+
+def transform_instances(instances: RingInstances, mat: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Camera-space vertices of every instance, (N, V, 3): instance and camera transforms composed into one
+    (4, 3) affine map per instance, applied to homogeneous row vectors in one batched matmul."""
+    affine = np.concatenate([(mat @ instance_matrices(instances)).transpose(0, 2, 1), (instances.offset @ mat.T)[:, None, :]], axis=1)
+    if instances.twist: # Every instance rolls its copy differently, so each multiplies its own (V, 3) points
+        out = np.matmul(roll_points(instances, instances.mesh.verts, instances.angles[:, None]), affine[:, :3], out=out)
+        out += affine[:, 3:]
+        return out
+    verts = instances.mesh.verts
+    return np.matmul(np.concatenate([verts, np.ones((len(verts), 1))], axis=1), affine, out=out)
+
+def take_instances(instances: RingInstances, idx: np.ndarray, mesh: Optional[SegmentMesh] = None) -> RingInstances:
+    """The instances at idx, optionally placing a different mesh (e.g. another LOD level)."""
+    return instances._replace(mesh=instances.mesh if mesh is None else mesh, angles=instances.angles[idx], scale=instances.scale[idx], offset=instances.offset[idx])
+
+def view_instances(instances: RingInstances, zoom: float, pan: np.ndarray) -> RingInstances:
+    """The instances zoomed by `zoom` about the ring centre, then moved by `pan` (a ring-frame translation)."""
+    return instances._replace(scale=instances.scale * zoom, offset=instances.offset * zoom + pan)
+
+def segment_bounds(instances: RingInstances) -> Tuple[np.ndarray, float]:
+    """Segment-local bounding sphere (centre, radius) of the canonical mesh. With a twist every point may roll
+    anywhere on its circle about the centre line, so the sphere covers those circles."""
+    v = instances.mesh.verts
+    if not instances.twist:
+        centre = (v.min(axis=0) + v.max(axis=0)) / 2
+        return centre, float(np.linalg.norm(v - centre, axis=1).max())
+    theta, r = np.arctan2(v[:, 1], v[:, 0]), np.hypot(v[:, 0], v[:, 1])
+    axis = np.stack([instances.twist_radius * np.cos(theta), instances.twist_radius * np.sin(theta), np.zeros_like(theta)], axis=1)
+    centre = (axis.min(axis=0) + axis.max(axis=0)) / 2
+    return centre, float((np.linalg.norm(axis - centre, axis=1) + np.hypot(r - instances.twist_radius, v[:, 2])).max())
+
+def cull_segments(instances: RingInstances, mat: np.ndarray, bounds: Tuple[np.ndarray, float], margin: float = 0.0) -> np.ndarray:
+    """Per-segment visibility: the projected bounding sphere's box, grown by `margin` pixels, meets the viewport.
+    In perspective the box is exact: per screen axis, the tangents from the eye to the sphere's outline in that
+    axis' plane (unbounded on a side the sphere wraps past the eye plane); spheres behind the near plane are culled."""
+    centre, radius = bounds
+    camera = np.einsum('nij,j->ni', mat @ instance_matrices(instances), centre) + instances.offset @ mat.T
+    radius = radius * instances.scale
+    if PROJECTION == 'perspective':
+        lateral, distance = camera[:, :2], (CAMERA_DISTANCE - camera[:, 2])[:, None]
+        angle = np.arctan2(lateral, distance)
+        half = np.arcsin(np.minimum(radius[:, None] / np.hypot(lateral, distance), 1.0))
+        lo, hi = angle - half, angle + half
+        lo = np.where(lo > -np.pi / 2, np.tan(np.maximum(lo, -np.pi / 2)), -np.inf) * focal_length()
+        hi = np.where(hi < np.pi / 2, np.tan(np.minimum(hi, np.pi / 2)), np.inf) * focal_length()
+        x_lo, x_hi, y_lo, y_hi = WIDTH * 0.5 + lo[:, 0], WIDTH * 0.5 + hi[:, 0], HEIGHT * 0.5 - hi[:, 1], HEIGHT * 0.5 - lo[:, 1]
+        ahead = distance[:, 0] + radius >= NEAR_PLANE
+    else:
+        x, y, _, _ = project_points(camera)
+        reach = radius * SCALE
+        x_lo, x_hi, y_lo, y_hi, ahead = x - reach, x + reach, y - reach, y + reach, True
+    return ahead & (x_hi + margin >= 0) & (x_lo - margin < WIDTH) & (y_hi + margin >= 0) & (y_lo - margin < HEIGHT)
+
+def arc_box(points: np.ndarray, span: float, twist_radius: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Segment-local bounding box (lo, hi) of profile `points` swept over `span` about angle 0, exact for the
+    true arc. With a twist_radius the profile may be rolled any amount about that circle (see roll_points)."""
+    r, z = points[:, 0], points[:, 1]
+    if twist_radius is not None:
+        reach = float(np.hypot(r - twist_radius, z).max())
+        r_lo, r_hi, z_lo, z_hi = twist_radius - reach, twist_radius + reach, -reach, reach
+    else: r_lo, r_hi, z_lo, z_hi = float(r.min()), float(r.max()), float(z.min()), float(z.max())
+    half = min(span / 2, math.pi)
+    y = r_hi * (math.sin(half) if half < math.pi / 2 else 1.0)
+    return np.array([min(r_lo * math.cos(half), r_hi * math.cos(half)), -y, z_lo]), np.array([r_hi, y, z_hi])
+
+BOX_EDGES = np.array([(c, c | bit) for c in range(8) for bit in (1, 2, 4) if not c & bit]) # Corner pairs, see boxes_on_screen
+CORNER_BITS = (np.arange(8)[:, None] >> np.array([2, 1, 0]) & 1).astype(bool) # Corner c takes hi on axis k when bit 2 - k is set
+
+def cull_boxes(instances: RingInstances, mat: np.ndarray, box: Tuple[np.ndarray, np.ndarray], margin: float = 0.0) -> np.ndarray:
+    """Per-instance visibility from a segment-local box (lo, hi), grown by `margin` pixels: much tighter than
+    cull_segments for long thin segments, whose bounding spheres are as big as their cross-section."""
+    lo, hi = box
+    return boxes_on_screen(mat @ instance_matrices(instances), instances.offset @ mat.T, lo, hi, margin)
+
+def boxes_on_screen(combined: np.ndarray, shift: np.ndarray, lo: np.ndarray, hi: np.ndarray, margin: float = 0.0) -> np.ndarray:
+    """Which boxes (lo, hi), (N, 3) or one shared (3,), reach the viewport grown by `margin` pixels once placed in
+    camera space by combined (N, 3, 3) @ p + shift (N, 3).
+    Orthographic: the projected box is the sum of its three projected half edges, tested exactly against the
+    viewport on the separating axes (screen x, y and each half edge's normal). Perspective: the screen bounds
+    of its 12 edges, clipped to the near plane."""
+    lo, hi = np.broadcast_to(lo, shift.shape), np.broadcast_to(hi, shift.shape)
+    if PROJECTION == 'perspective':
+        corners = np.where(CORNER_BITS, hi[:, None, :], lo[:, None, :]) # (N, 8, 3)
+        camera = np.einsum('nij,ncj->nci', combined, corners) + shift[:, None, :]
+        ends, kept = clip_near_plane(camera[:, BOX_EDGES].reshape(-1, 2, 3))
+        x, y, _, _ = project_points(ends[:, :2].reshape(-1, 3))
+        kept = np.repeat(kept > 0, 2).reshape(len(camera), 2 * len(BOX_EDGES))
+        x, y = x.reshape(kept.shape), y.reshape(kept.shape)
+        x_lo, x_hi = np.where(kept, x, np.inf).min(axis=1), np.where(kept, x, -np.inf).max(axis=1)
+        y_lo, y_hi = np.where(kept, y, np.inf).min(axis=1), np.where(kept, y, -np.inf).max(axis=1)
+        return kept.any(axis=1) & (x_hi + margin >= 0) & (x_lo - margin < WIDTH) & (y_hi + margin >= 0) & (y_lo - margin < HEIGHT)
+    x, y, _, _ = project_points(np.einsum('nij,nj->ni', combined, (lo + hi) / 2) + shift)
+    half_edges = combined[:, :2, :] * ((hi - lo) / 2)[:, None, :] * np.array([[SCALE], [-SCALE]]) # (N, 2, 3) screen vectors
+    axes = np.concatenate([np.broadcast_to(np.eye(2), (len(x), 2, 2)), np.stack([-half_edges[:, 1], half_edges[:, 0]], axis=1)], axis=2)
+    gap = np.abs((x - WIDTH * 0.5)[:, None] * axes[:, 0] + (y - HEIGHT * 0.5)[:, None] * axes[:, 1])
+    reach = np.abs(np.einsum('nkj,nka->nja', half_edges, axes)).sum(axis=1) + (WIDTH * 0.5 + margin) * np.abs(axes[:, 0]) + (HEIGHT * 0.5 + margin) * np.abs(axes[:, 1])
+    return ~(gap > reach).any(axis=1)
+
+def morton_codes(points: np.ndarray) -> np.ndarray:
+    """30-bit Morton (Z-order) codes of (N, 3) points quantized to 1024 steps across their bounding box."""
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    q = ((points - lo) / np.maximum(hi - lo, 1e-12) * 1023).astype(np.int64)
+    for shift, mask in ((16, 0x030000FF), (8, 0x0300F00F), (4, 0x030C30C3), (2, 0x09249249)): q = (q | q << shift) & mask # Spread 10 bits 3 apart
+    return q[:, 0] << 2 | q[:, 1] << 1 | q[:, 2]
+
+def view_ray(mat: np.ndarray, zoom: float, pan: np.ndarray, pos: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Ring-frame ray through screen pixel `pos` for the view camera = mat @ (zoom * p + pan) (see view_instances).
+    Returns: origin, direction, least parameter in view. The parameter is camera-space distance along -z,
+    from the eye in perspective (visible past NEAR_PLANE) and from the z = 0 plane when orthographic."""
+    if PROJECTION == 'perspective':
+        origin = np.array([0.0, 0.0, CAMERA_DISTANCE])
+        direction, t_min = np.array([(pos[0] - WIDTH * 0.5) / focal_length(), (HEIGHT * 0.5 - pos[1]) / focal_length(), -1.0]), NEAR_PLANE
+    else: origin, direction, t_min = np.array([(pos[0] - WIDTH * 0.5) / SCALE, (HEIGHT * 0.5 - pos[1]) / SCALE, 0.0]), np.array([0.0, 0.0, -1.0]), -np.inf
+    return (mat.T @ origin - pan) / zoom, mat.T @ direction / zoom, t_min
+
+def ray_quads(origin: np.ndarray, direction: np.ndarray, corners: np.ndarray) -> np.ndarray:
+    """Ray parameter where the ray meets each quad (K, 4, 3), split into triangles 012 and 023; inf on a miss."""
+    t = np.full(len(corners), np.inf)
+    for a, b, c in ((0, 1, 2), (0, 2, 3)): # Moller-Trumbore
+        e1, e2, s = corners[:, b] - corners[:, a], corners[:, c] - corners[:, a], origin - corners[:, a]
+        p, q = np.cross(direction, e2), np.cross(s, e1)
+        det = np.einsum('kj,kj->k', e1, p)
+        inv = 1.0 / np.where(det != 0, det, 1.0)
+        u, v = np.einsum('kj,kj->k', s, p) * inv, (q @ direction) * inv
+        hit = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1)
+        t = np.minimum(t, np.where(hit, np.einsum('kj,kj->k', e2, q) * inv, np.inf))
+    return t
+
+class FaceBVH:
+    """Bounding-volume hierarchy over the ring-frame boxes of quads, for viewport culling, picking and coarse
+    depth ordering in O(log F) node visits per hit. Faces are ordered along a Morton curve and cut into leaves
+    of LEAF_SIZE; the tree over the leaves is complete and implicit (node n has children 2n and 2n + 1), so
+    there are no pointers and refit is one vectorized min/max per level. Views only rotate, zoom and pan the
+    ring, which the queries apply to their rays and boxes instead, so the tree never changes with the camera."""
+    LEAF_SIZE = 8
+
+    def __init__(self, verts: np.ndarray, faces: np.ndarray, leaf_size: int = LEAF_SIZE):
+        self.faces, self.leaf_size = faces, leaf_size
+        order = np.argsort(morton_codes(verts[faces].mean(axis=1)), kind='stable') if len(faces) else np.zeros(0, dtype=np.int64)
+        self.n_leaves = 1 << max(0, -(-len(faces) // leaf_size) - 1).bit_length()
+        self.slots = np.full(self.n_leaves * leaf_size, -1, dtype=np.int64) # Face of each leaf slot, -1: empty
+        self.slots[:len(order)] = order
+        self.slots = self.slots.reshape(self.n_leaves, leaf_size)
+        self.lo, self.hi = np.empty((2 * self.n_leaves, 3)), np.empty((2 * self.n_leaves, 3))
+        self.refit(verts)
+
+    def refit(self, verts: np.ndarray) -> None:
+        """Recompute every box bottom-up after the vertices moved, keeping the tree."""
+        self.verts, corners = verts, verts[self.faces]
+        self.face_lo, self.face_hi = corners.min(axis=1), corners.max(axis=1)
+        empty, n = (self.slots < 0)[..., None], self.n_leaves
+        self.lo[n:] = np.where(empty, np.inf, self.face_lo[self.slots]).min(axis=1) # Empty leaves get inverted boxes
+        self.hi[n:] = np.where(empty, -np.inf, self.face_hi[self.slots]).max(axis=1)
+        while n > 1:
+            self.lo[n // 2:n] = np.minimum(self.lo[n:2 * n:2], self.lo[n + 1:2 * n:2])
+            self.hi[n // 2:n] = np.maximum(self.hi[n:2 * n:2], self.hi[n + 1:2 * n:2])
+            n //= 2
+
+    def descend(self, test: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> np.ndarray:
+        """Leaves whose every ancestor box passes test(lo, hi), one vectorized test per tree level."""
+        nodes = np.ones(1, dtype=np.int64)
+        while True:
+            nodes = nodes[self.lo[nodes, 0] <= self.hi[nodes, 0]] # Skip empty subtrees
+            if len(nodes): nodes = nodes[test(self.lo[nodes], self.hi[nodes])]
+            if not len(nodes) or nodes[0] >= self.n_leaves: return nodes - self.n_leaves
+            nodes = (2 * nodes[:, None] + np.arange(2)).ravel()
+
+    def leaf_faces(self, leaves: np.ndarray) -> np.ndarray:
+        faces = self.slots[leaves].ravel()
+        return faces[faces >= 0]
+
+    def cull(self, mat: np.ndarray, zoom: float = 1.0, pan: Optional[np.ndarray] = None, margin: float = 0.0) -> np.ndarray:
+        """Faces whose boxes reach the viewport (see boxes_on_screen) under the view of view_ray."""
+        shift = mat @ (np.zeros(3) if pan is None else pan)
+        def on_screen(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+            return boxes_on_screen(np.broadcast_to(zoom * mat, (len(lo), 3, 3)), np.broadcast_to(shift, lo.shape), lo, hi, margin)
+        faces = self.leaf_faces(self.descend(on_screen))
+        return faces[on_screen(self.face_lo[faces], self.face_hi[faces])] if len(faces) else faces
+
+    def crossing(self, origin: np.ndarray, direction: np.ndarray, t_min: float) -> np.ndarray:
+        """Faces whose own boxes the ray origin + t * direction (t >= t_min) passes through."""
+        inv = 1.0 / np.where(direction != 0, direction, 1e-300)
+        def crossed(lo: np.ndarray, hi: np.ndarray) -> np.ndarray: # Slab test
+            t0, t1 = (lo - origin) * inv, (hi - origin) * inv
+            return np.maximum(np.minimum(t0, t1).max(axis=1), t_min) <= np.maximum(t0, t1).min(axis=1)
+        faces = self.leaf_faces(self.descend(crossed))
+        return faces[crossed(self.face_lo[faces], self.face_hi[faces])] if len(faces) else faces
+
+    def pick(self, mat: np.ndarray, zoom: float, pan: np.ndarray, pos: Tuple[float, float]) -> Optional[Tuple[int, float]]:
+        """Nearest face under screen pixel `pos` and its distance along the view ray (see view_ray), or None."""
+        origin, direction, t_min = view_ray(mat, zoom, pan, pos)
+        faces = self.crossing(origin, direction, t_min)
+        t = ray_quads(origin, direction, self.verts[self.faces[faces]])
+        t[t < t_min] = np.inf
+        if not len(t) or not np.isfinite(t.min()): return None
+        best = int(np.argmin(t))
+        return int(faces[best]), float(t[best])
+
+    def back_to_front(self, mat: np.ndarray, depth: int) -> np.ndarray:
+        """Faces in coarse painter order: the subtrees `depth` levels below the root, sorted back to front by the
+        camera depth of their box centres, each listing its faces in Morton order. Zoom and pan keep the order."""
+        level = min(depth, self.n_leaves.bit_length() - 1)
+        nodes = np.arange(1 << level, 2 << level)
+        nodes = nodes[self.lo[nodes, 0] <= self.hi[nodes, 0]]
+        nodes = nodes[np.argsort((self.lo[nodes] + self.hi[nodes]) @ mat[2], kind='stable')]
+        faces = self.slots.reshape(1 << level, -1)[nodes - (1 << level)].ravel()
+        return faces[faces >= 0]
+
+def segment_tree(instances: RingInstances, bounds: Tuple[np.ndarray, float]) -> FaceBVH:
+    """FaceBVH with one item per instance: the ring-frame cube around its bounding sphere (see segment_bounds),
+    as the cube's 8 corners. O(segments) to build, whatever the detail level, and unchanged by LOD."""
+    centre, radius = bounds
+    centres = np.einsum('nij,j->ni', instance_matrices(instances), centre) + instances.offset
+    corners = centres[:, None, :] + (radius * instances.scale)[:, None, None] * np.where(CORNER_BITS, 1.0, -1.0)
+    return FaceBVH(corners.reshape(-1, 3), np.arange(8 * len(centres)).reshape(-1, 8))
+
+def pick_segments(tree: FaceBVH, instances: RingInstances, lods: List[SegmentMesh], level: np.ndarray, mat: np.ndarray,
+                  zoom: float, pan: np.ndarray, pos: Tuple[float, float]) -> Optional[Tuple[int, int, float]]:
+    """Nearest drawn face under screen pixel `pos`: (segment, face within lods[level[segment]], ray parameter),
+    or None. The segment tree (see segment_tree) narrows the view ray to the few segments it crosses; only their
+    faces, at the level each is drawn at (-1: culled), are placed and tested."""
+    origin, direction, t_min = view_ray(mat, zoom, pan, pos)
+    segments = tree.crossing(origin, direction, t_min)
+    segments, best = segments[level[segments] >= 0], None
+    for l in np.unique(level[segments]).tolist():
+        idx, mesh = segments[level[segments] == l], lods[l]
+        corners = transform_instances(take_instances(instances, idx, mesh), np.eye(3))[:, mesh.faces].reshape(-1, 4, 3)
+        t = ray_quads(origin, direction, corners)
+        t[t < t_min] = np.inf
+        hit = int(np.argmin(t))
+        if np.isfinite(t[hit]) and (best is None or t[hit] < best[2]): best = (int(idx[hit // len(mesh.faces)]), hit % len(mesh.faces), float(t[hit]))
+    return best
+
+def place_points(instances: RingInstances, points: np.ndarray, instance_index: np.ndarray) -> np.ndarray:
+    """Move segment-local points (e.g. city lights) of the given instances into the ring frame."""
+    if instances.twist: points = roll_points(instances, points, instances.angles[instance_index])
+    return np.einsum('lij,lj->li', instance_matrices(instances)[instance_index], points) + instances.offset[instance_index]
+
+def lod_chain() -> Tuple[int, ...]:
+    """Subdivision count of every detail level, coarsest first."""
+    return tuple(LOD_SUBDIVISIONS) if LOD_PIXELS is not None else (SUBDIVISIONS,)
+
+def store_faces(face_offsets: np.ndarray, segment_faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Every light's segment and face within that segment, (N,) int32 each, from a LightStore's CSR face index."""
+    face = np.repeat(np.arange(len(face_offsets) - 1), np.diff(face_offsets))
+    segment = np.repeat(np.arange(len(segment_faces) - 1, dtype=np.int32), np.diff(face_offsets[segment_faces]))
+    return segment, (face - segment_faces[segment]).astype(np.int32)
+
+def lod_lights(face: np.ndarray, uv: np.ndarray, fine: int, coarse_mesh: SegmentMesh, coarse: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-attach lights at (face, uv) of a `fine`-subdivision segment (see store_faces) to the same spots on
+    its `coarse` level. Side faces are numbered ring by ring (see sweep_profile), so fine // coarse consecutive
+    fine rings share one coarse ring and the light's u is rescaled into it; caps map to caps.
+    Returns: segment-local positions (N, 3) float32, face within the coarse segment (N,) int32"""
+    n_profile, k = len(coarse_mesh.verts) // (coarse + 1), fine // coarse
+    ring, is_side = face // n_profile, face < fine * n_profile
+    coarse_face = np.where(is_side, ring // k * n_profile + face % n_profile, face - (fine - coarse) * n_profile)
+    u = np.where(is_side, ((ring % k).astype(np.float32) + uv[:, 0]) / np.float32(k), uv[:, 0])[:, None]
+    v = uv[:, 1:]
+    a, b, c, d = coarse_mesh.verts[coarse_mesh.faces].transpose(1, 0, 2).astype(np.float32)
+    positions = np.take(a, coarse_face, axis=0) # Bilinear point as a + u (b - a) + v (d - a) + uv (a - b + c - d), per-face terms
+    for term, weight in ((b - a, u), (d - a, v), (a - b + c - d, u * v)): positions += weight * np.take(term, coarse_face, axis=0)
+    return positions, coarse_face.astype(np.int32)
+
+def attach_lights(lods: List[SegmentMesh], chain: Tuple[int, ...], level: np.ndarray, face: np.ndarray, uv: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """lod_lights for lights drawn at mixed levels: light i moves from the finest level onto lods[level[i]]."""
+    positions, faces = np.empty((len(face), 3), dtype=np.float32), np.empty(len(face), dtype=np.int32)
+    for l in np.unique(level).tolist():
+        pick = level == l
+        positions[pick], faces[pick] = lod_lights(face[pick], uv[pick], chain[-1], lods[l], chain[l])
+    return positions, faces
+
+def select_lod(instances: RingInstances, mat: np.ndarray, arc: np.ndarray, chain: Tuple[int, ...], pixels: float) -> np.ndarray:
+    """Per-segment index into the LOD chain: the coarsest level whose subdivisions each span at most `pixels`
+    of the segment's projected arc (`arc`: canonical points along the segment's centre line)."""
+    camera = np.matmul(arc, (mat @ instance_matrices(instances)).transpose(0, 2, 1)) + (instances.offset @ mat.T)[:, None, :]
+    x, y, _, _ = project_points(camera.reshape(-1, 3))
+    screen = np.stack([x, y], axis=1).reshape(len(camera), len(arc), 2)
+    length = np.linalg.norm(np.diff(screen, axis=1), axis=2).sum(axis=1)
+    return np.minimum(np.searchsorted(chain, np.ceil(length / pixels)), len(chain) - 1)
+
+class LodFrame(NamedTuple):
+    """One frame's ring topology, assembled from each segment's chosen level; segments stay in index order."""
+    vert_start: np.ndarray      # (N + 1,) first vertex of each segment
+    face_start: np.ndarray      # (N + 1,) first face of each segment
+    faces: np.ndarray           # (F, 4) int32
+    edges: np.ndarray           # (E, 2) int32
+    face_edges: np.ndarray      # (F, 4) int32, see SegmentMesh
+    edge_flipped: np.ndarray    # (F, 4) bool
+
+def assemble_lod(lods: List[SegmentMesh], level: np.ndarray) -> LodFrame:
+    """Stack every segment's chosen LOD mesh into packed arrays, vertex, face and edge indices offset into the
+    frame's ranges (see LodFrame). Culled segments (level -1) keep an empty range."""
+    starts = [np.concatenate(([0], np.cumsum(np.array([len(getattr(m, name)) for m in lods] + [0])[level]))) for name in ('verts', 'faces', 'edges')]
+    vert_start, face_start, edge_start = starts
+    faces, face_edges = np.empty((face_start[-1], 4), dtype=np.int32), np.empty((face_start[-1], 4), dtype=np.int32)
+    edges, edge_flipped = np.empty((edge_start[-1], 2), dtype=np.int32), np.empty((face_start[-1], 4), dtype=bool)
+    for l, mesh in enumerate(lods):
+        idx = np.flatnonzero(level == l)
+        if not len(idx): continue
+        rows = (face_start[idx, None] + np.arange(len(mesh.faces))).ravel()
+        faces[rows] = (mesh.faces + vert_start[idx, None, None]).reshape(-1, 4)
+        face_edges[rows] = np.where(mesh.face_edges >= 0, mesh.face_edges + edge_start[idx, None, None], -1).reshape(-1, 4)
+        edge_flipped[rows] = np.tile(mesh.edge_flipped, (len(idx), 1))
+        edges[(edge_start[idx, None] + np.arange(len(mesh.edges))).ravel()] = (mesh.edges + vert_start[idx, None, None]).reshape(-1, 2)
+    return LodFrame(vert_start, face_start, faces, edges, face_edges, edge_flipped)
+
+def transform_lod(instances: RingInstances, lods: List[SegmentMesh], level: np.ndarray, vert_start: np.ndarray, mat: np.ndarray, out: np.ndarray) -> None:
+    """Write camera-space vertices of every segment at its chosen level into out[vert_start[n]:vert_start[n + 1]]."""
+    for l, mesh in enumerate(lods):
+        idx = np.flatnonzero(level == l)
+        if not len(idx): continue
+        out[(vert_start[idx, None] + np.arange(len(mesh.verts))).ravel()] = transform_instances(take_instances(instances, idx, mesh), mat).reshape(-1, 3)
+
+def ring_instances(mesh: SegmentMesh, count: Optional[int] = None, index: Optional[np.ndarray] = None, stride: int = 1) -> RingInstances:
+    """Copies of the canonical segment spread over ARC_SPAN, rolled by TWIST in total: all of a ring of `count`
+    segments (default N_SEGMENTS), or those at `index`, where instance j stands for segments j * stride up to
+    (j + 1) * stride (see SegmentStream)."""
+    count = N_SEGMENTS if count is None else count
+    index = np.arange(-(-count // stride)) if index is None else index
+    return make_ring_instances(mesh, ARC_START + ARC_SPAN / count * stride * (index + 0.5), twist=TWIST / ARC_SPAN,
+                               twist_radius=(R_INNER + R_OUTER) / 2, twist_start=ARC_START)
+
+def scene_config() -> Dict[str, object]:
+    """Every setting the generated scene depends on; its hash names the cache entry (see load_or_build)."""
+    names = ('N_SEGMENTS', 'ARC_START', 'ARC_SPAN', 'ANGLE_SPAN', 'R_INNER', 'R_OUTER', 'SEG_HEIGHT', 'PROFILE', 'BEVEL_SIZE', 'TWIST', 'LIGHTS_PER_SEGMENT', 'RNG_SEED')
+    return {'version': 7, 'lod_chain': lod_chain(), **{name: globals()[name] for name in names}} # Bump version when generation changes
+
+def build_scene() -> Dict[str, np.ndarray]:
+    """Generate every level of the canonical segment and the city lights on its finest level. Lights are stored
+    as their finest face (the CSR index) and uv only, and re-attached and placed per frame (see attach_lights)."""
+    step, chain = ARC_SPAN / N_SEGMENTS, lod_chain()
+    profile = PROFILES[PROFILE](R_INNER, R_OUTER, SEG_HEIGHT, BEVEL_SIZE)
+    lods = [sweep_profile(profile, 0.0, ANGLE_SPAN, subdivs) for subdivs in chain] # Canonical, at angle 0
+    lights = generate_light_store([lods[-1]] * N_SEGMENTS, LIGHTS_PER_SEGMENT, np.random.default_rng(RNG_SEED))
+    arrays = {f'lod{l}_{k}': v for l, mesh in enumerate(lods) for k, v in mesh._asdict().items()}
+    arrays.update({'lights_' + k: v for k, v in lights._asdict().items() if k != 'positions'})
+    return arrays
+
+CACHE_ENTRY = re.compile(r'[0-9a-f]{16}|\.staging-.+') # Names load_or_build writes under cache_dir
+
+def load_or_build(cache_dir: Optional[str], config: Dict[str, object], build: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Memory-map the arrays cached under cache_dir/<config hash>/, or build them and save them there as .npy.
+    A changed config hashes to a new entry, and stale entries (and staging left by a crash) are removed when it
+    is written; anything else in cache_dir is left alone."""
+    if cache_dir is None: return build()
+    entry = os.path.join(cache_dir, hashlib.sha1(repr(sorted(config.items())).encode()).hexdigest()[:16])
+    if os.path.isdir(entry):
+        return {name[:-4]: np.load(os.path.join(entry, name), mmap_mode='r') for name in os.listdir(entry) if name.endswith('.npy')}
+    arrays = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    for stale in os.listdir(cache_dir):
+        if CACHE_ENTRY.fullmatch(stale): shutil.rmtree(os.path.join(cache_dir, stale), ignore_errors=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=cache_dir) # Renamed into place once complete, so a crash never leaves half an entry
+    for name, array in arrays.items(): np.save(os.path.join(staging, name + '.npy'), array)
+    os.replace(staging, entry)
+    return arrays
+
+class StreamLevel(NamedTuple):
+    """The canonical mesh chain of one SegmentStream stride."""
+    lods: List[SegmentMesh]     # One per lod_chain() level
+    box: Tuple[np.ndarray, np.ndarray] # arc_box of the swept profile
+    arc: np.ndarray             # Centre line of the finest level, for select_lod
+
+class SegmentLights(NamedTuple):
+    """One streamed segment's city lights on its finest level, re-attached per frame (see attach_lights)."""
+    faces: np.ndarray           # (N,) int32, face within the finest segment
+    uv: np.ndarray              # (N, 2) float32
+    sizes: np.ndarray           # (N,) float32
+    colors: np.ndarray          # (N, 3) uint8
+
+class SegmentStream:
+    """A ring of `count` segments generated on demand, for rings far too big to build up front.
+    Each frame only instances that meet the view are placed. The search starts from at most `budget` proxies,
+    each one mesh spanning a power-of-two run of segments, and splits the visible ones in half until the next
+    split would exceed `budget`. A zoomed-out megastructure is a few hundred proxies; zoomed in, real segments.
+    City lights of real segments are generated per segment from (seed, index) into an LRU cache of `cache_size`
+    segments, and `prefetch` segments past each end of the visible runs are generated ahead on a worker thread.
+    Memory is O(budget + cache_size + log(count)) whatever the ring size."""
+    def __init__(self, count: int, budget: int, cache_size: int, prefetch: int, seed: Optional[int] = None):
+        self.count, self.budget, self.cache_size, self.prefetch_span = count, budget, max(cache_size, budget), prefetch
+        self.seed = np.random.SeedSequence(seed).entropy # Random per launch when None, like RNG_SEED
+        self.profile = PROFILES[PROFILE](R_INNER, R_OUTER, SEG_HEIGHT, BEVEL_SIZE)
+        self.gap = 1.0 - ANGLE_SPAN / (ARC_SPAN / N_SEGMENTS) # Empty share of each segment's arc step
+        self.levels: Dict[int, StreamLevel] = {}
+        self.lights: 'OrderedDict[int, SegmentLights]' = OrderedDict()
+        self.lock, self.generated = threading.Lock(), 0
+        self.worker, self.pending = ThreadPoolExecutor(max_workers=1, thread_name_prefix='segment-prefetch'), None
+        self.level(1) # Real segments, read by the worker
+
+    def level(self, stride: int) -> StreamLevel:
+        """Mesh chain of instances spanning `stride` segments (each keeps one segment gap), swept on first use."""
+        if stride not in self.levels:
+            span, chain = (stride - self.gap) * ARC_SPAN / self.count, lod_chain()
+            lods = [sweep_profile(self.profile, 0.0, span, subdivs) for subdivs in chain]
+            box = arc_box(self.profile.points, span, (R_INNER + R_OUTER) / 2 if TWIST else None)
+            self.levels[stride] = StreamLevel(lods, box, lods[-1].verts.reshape(chain[-1] + 1, -1, 3).mean(axis=1))
+        return self.levels[stride]
+
+    def instances(self, stride: int, index: np.ndarray, zoom: float = 1.0, pan: Optional[np.ndarray] = None) -> RingInstances:
+        instances = ring_instances(self.level(stride).lods[-1], self.count, index, stride)
+        return view_instances(instances, zoom, np.zeros(3) if pan is None else pan)
+
+    def visible(self, mat: np.ndarray, zoom: float = 1.0, pan: Optional[np.ndarray] = None, margin: float = 0.0) -> Tuple[int, np.ndarray]:
+        """The finest stride whose visible instances fit the budget, and their indices (see cull_boxes)."""
+        stride = 1 << max(0, math.ceil(math.log2(self.count / self.budget)))
+        index = np.arange(-(-self.count // stride))
+        while True:
+            index = index[cull_boxes(self.instances(stride, index, zoom, pan), mat, self.level(stride).box, margin)]
+            if not len(index): return stride, index # Nothing on screen at this level, nor at any finer one
+            children = (index[:, None] * 2 + np.arange(2)).ravel()
+            children = children[children * (stride // 2) < self.count]
+            if stride == 1 or len(children) > self.budget: return stride, index
+            stride, index = stride // 2, children
+
+    def generate(self, index: int) -> SegmentLights:
+        store = generate_light_store([self.levels[1].lods[-1]], LIGHTS_PER_SEGMENT, np.random.default_rng([self.seed, index]))
+        return SegmentLights(store_faces(store.face_offsets, store.segment_faces)[1], store.uv, store.sizes, store.colors)
+
+    def store(self, made: Dict[int, SegmentLights]) -> None:
+        with self.lock:
+            self.lights.update(made)
+            self.generated += len(made)
+            while len(self.lights) > self.cache_size: self.lights.popitem(last=False) # Least recently used
+
+    def segment_lights(self, index: np.ndarray) -> List[SegmentLights]:
+        """Lights of the real segments at `index`, generating (and caching) the ones not in the cache."""
+        index = index.tolist()
+        with self.lock:
+            found = {i: self.lights[i] for i in index if i in self.lights}
+            for i in found: self.lights.move_to_end(i)
+        made = {i: self.generate(i) for i in index if i not in found}
+        if made: self.store(made)
+        return [found[i] if i in found else made[i] for i in index]
+
+    def frame_lights(self, instances: RingInstances, index: np.ndarray, level: np.ndarray):
+        """City lights of the real segments `instances` (at `index`, drawn at `level`) for one frame.
+        Returns: ring-frame positions (N, 3), face within its segment's level (N,), position in index (N,), sizes, colors"""
+        entries = self.segment_lights(index)
+        if not entries: return np.zeros((0, 3)), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros((0, 3), dtype=np.uint8)
+        segment = np.repeat(np.arange(len(entries)), [len(entry.sizes) for entry in entries])
+        points, faces = attach_lights(self.levels[1].lods, lod_chain(), level[segment], np.concatenate([entry.faces for entry in entries]),
+                                      np.concatenate([entry.uv for entry in entries]))
+        return (place_points(instances, points, segment), faces, segment, np.concatenate([entry.sizes for entry in entries]),
+                np.concatenate([entry.colors for entry in entries]))
+
+    def prefetch(self, index: np.ndarray) -> Optional[Future]:
+        """Generate the lights of segments just past each end of the visible runs in `index` on the worker,
+        unless it is still busy with the last batch."""
+        if (self.pending is not None and not self.pending.done()) or len(index) == 0: return None
+        breaks = np.flatnonzero(np.diff(index) != 1)
+        ahead = np.arange(1, self.prefetch_span + 1)
+        near = np.concatenate([(index[np.r_[0, breaks + 1]][:, None] - ahead).ravel(), (index[np.r_[breaks, -1]][:, None] + ahead).ravel()])
+        near = np.setdiff1d(near[(near >= 0) & (near < self.count)], index)[:self.cache_size - len(index)]
+        self.pending = self.worker.submit(self.fill, near)
+        return self.pending
+
+    def fill(self, index: np.ndarray) -> None:
+        with self.lock: missing = [i for i in index.tolist() if i not in self.lights]
+        self.store({i: self.generate(i) for i in missing})
+
+    def close(self) -> None:
+        self.worker.shutdown(wait=False, cancel_futures=True)
+
+def painter_depths(depth: np.ndarray, faces: np.ndarray, double_sided: bool = True) -> np.ndarray:
+    """Sort keys for face entries: entry 2*f is face f's front side, 2*f + 1 its back side. Double-sided, every
+    face has both entries; otherwise the keys are per face and painter_entries picks each face's one side."""
+    centroid_z = depth[faces].mean(axis=1)
+    if not double_sided: return centroid_z
+    entries = np.empty(2 * len(faces))
+    entries[0::2], entries[1::2] = centroid_z, centroid_z - DOUBLE_FACE_Z_OFFSET
+    return entries
+
+def painter_entries(order: np.ndarray, back: np.ndarray) -> np.ndarray:
+    """Entries (see painter_depths) for faces in draw order, each drawn once from the side it shows."""
+    return order << 1 | back[order]
+
+def painter_order(depth: np.ndarray, faces: np.ndarray, back: Optional[np.ndarray] = None) -> np.ndarray:
+    """Back-to-front draw order over face entries (see painter_depths), single-sided when `back` flags are given."""
+    order = np.argsort(painter_depths(depth, faces, back is None), kind='stable')
+    return order if back is None else painter_entries(order, back)
+
+class RingLayout(NamedTuple):
+    """Parametric face positions of a ring whose segments are copies of one segment rotated about Z."""
+    angles: np.ndarray          # (N,) segment centre angles
+    radius: np.ndarray          # (F_seg,) face centroid distance from the ring axis
+    offset: np.ndarray          # (F_seg,) face centroid angle relative to its segment centre
+    height: np.ndarray          # (F_seg,) face centroid Z
+
+def instance_layout(instances: RingInstances) -> Optional[RingLayout]:
+    """Ring layout straight from the canonical segment, or None when instances are scaled, offset or twisted."""
+    if not (np.all(instances.scale == 1.0) and not np.any(instances.offset)) or instances.twist: return None
+    c = instances.mesh.verts[instances.mesh.faces].mean(axis=1)
+    return RingLayout(instances.angles, np.hypot(c[:, 0], c[:, 1]), np.arctan2(c[:, 1], c[:, 0]), c[:, 2])
+
+def lod_painter_order(mat: np.ndarray, layouts: List[RingLayout], level: np.ndarray, face_start: np.ndarray,
+                      back: Optional[np.ndarray] = None) -> np.ndarray:
+    """Back-to-front entry order (see painter_depths) derived from segment angles instead of vertex centroids.
+    Orthographic depth of a point at (radius, angle, height) is A * radius * cos(angle - phi) + m22 * height,
+    so segments order by cos(angle - phi) and each segment's faces by that closed form. Segment n uses
+    layouts[level[n]] and owns faces face_start[n]:face_start[n + 1]. Single-sided when `back` flags are given."""
+    angles = layouts[0].angles
+    amp, phi = math.hypot(mat[2, 0], mat[2, 1]), math.atan2(mat[2, 1], mat[2, 0])
+    seg_order = np.argsort(np.cos(angles - phi), kind='stable')
+    rows = np.full((len(angles), max(len(layout.radius) for layout in layouts)), -1, dtype=np.int64) # Padded per-segment face order
+    for l, layout in enumerate(layouts):
+        idx = np.flatnonzero(level == l)
+        keys = amp * layout.radius * np.cos(angles[idx, None] + layout.offset - phi) + mat[2, 2] * layout.height
+        rows[idx, :len(layout.radius)] = face_start[idx, None] + np.argsort(keys, axis=1, kind='stable')
+    faces = rows[seg_order].ravel()
+    faces = faces[faces >= 0]
+    if back is not None: return painter_entries(faces, back)
+    entries = np.empty(2 * len(faces), dtype=np.int64)
+    entries[0::2], entries[1::2] = 2 * faces + 1, 2 * faces # Back side first, as DOUBLE_FACE_Z_OFFSET does
+    return entries
 
 def main():
     pygame.init()
@@ -147,21 +1250,32 @@ def main():
     pygame.display.set_caption("Dyson Ring - 3/4 Orbital View")
     clock, font = pygame.time.Clock(), pygame.font.SysFont("Glass TTY VT220", 18)
 
-    segments = [] 
-    for i in range(N_SEGMENTS):
-        step = ARC_SPAN / N_SEGMENTS
-        v, e, f = make_curved_beveled_segment(ARC_START + step * (i + 0.5), ANGLE_SPAN, R_INNER, R_OUTER, SEG_HEIGHT, SUBDIVISIONS, BEVEL_SIZE)
-        face_lights = [[] for _ in range(len(f))]
-        if len(f) > 0 and LIGHTS_PER_SEGMENT > 0:
-            for _ in range(LIGHTS_PER_SEGMENT):
-                f_idx = random.randrange(len(f))
-                face_lights[f_idx].extend(generate_lights_for_face(v, f[f_idx][0], 1))
-        segments.append((v, e, f, face_lights)) 
+    chain = lod_chain()
+    stream = SegmentStream(STREAM_SEGMENTS, STREAM_BUDGET, STREAM_CACHE, STREAM_PREFETCH, RNG_SEED) if STREAM_SEGMENTS else None
+    if stream is None:
+        scene = load_or_build(CACHE_DIR if RNG_SEED is not None else None, scene_config(), build_scene)
+        lods = [SegmentMesh(*(scene[f'lod{l}_{name}'] for name in SegmentMesh._fields)) for l in range(len(chain))]
+        light_sizes, light_colors, light_uv = scene['lights_sizes'], scene['lights_colors'], scene['lights_uv']
+        instances = ring_instances(lods[-1])
+        lod_arc = lods[-1].verts.reshape(chain[-1] + 1, -1, 3).mean(axis=1) # Centre line of the finest level, for select_lod
+        light_segment, light_face = store_faces(scene['lights_face_offsets'], scene['lights_segment_faces']) # Finest face within the segment
+        bounds, light_margin = segment_bounds(instances), float(np.max(light_sizes, initial=0.0)) + 1 # Lights may overhang their segment
+        splatter = LightSplatter(screen, light_sizes, light_colors)
+        layouts = [instance_layout(instances._replace(mesh=mesh)) for mesh in lods] if DEPTH_SORT == 'analytic' and PROJECTION == 'orthographic' else [None]
+        face_tree = segment_tree(instances, bounds) # One box per segment, for picking
+    else: light_margin, layouts, face_tree = 9.0, [None], None # generate_light_store's biggest light, plus one; proxies change every frame
+    if PROJECTION == 'perspective': light_margin = LightSplatter.MAX_RADIUS + 1.0 # Near lights grow up to the splatter's cap
+    if any(layout is None for layout in layouts): layouts = None # Generic sort
+    fill_polygon = TranslucentFiller().fill if FILL_MODE == 'blend' else SurfaceFiller().fill
+    compositor = {'coverage': CoverageCompositor, 'numpy': NumpyRasterizer}.get(FILL_MODE, lambda: None)()
 
     spin_angle, view_pitch, view_yaw = 0.0, TILT, INITIAL_YAW
-    dragging, last_mouse_pos = False, (0, 0)
-    bg_stars = generate_bg_stars(WIDTH, HEIGHT, BG_STAR_COUNT)
-    
+    zoom, pan = 1.0, np.zeros(3) # Pan: camera-space translation, so it stays screen aligned
+    dragging, panning, last_mouse_pos = False, False, (0, 0)
+    star_rng = np.random.default_rng(None if RNG_SEED is None else RNG_SEED + 1)
+    if BG_MODE == 'palette': background = IndexedBackgroundLayer((WIDTH, HEIGHT), generate_bg_stars(WIDTH, HEIGHT, BG_STAR_COUNT, star_rng, indexed=True), star_rng)
+    else: background = BackgroundLayer((WIDTH, HEIGHT), generate_bg_stars(WIDTH, HEIGHT, BG_STAR_COUNT, star_rng), star_rng)
+
     running = True
     while running:
         dt = clock.tick(FPS) * 0.001
@@ -169,76 +1283,120 @@ def main():
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE): running = False
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1: dragging, last_mouse_pos = True, event.pos
             elif event.type == pygame.MOUSEBUTTONUP and event.button == 1: dragging = False
-            elif event.type == pygame.MOUSEMOTION and dragging:
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 3: panning, last_mouse_pos = True, event.pos
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 3: panning = False
+            elif event.type == pygame.MOUSEMOTION and (dragging or panning):
                 dx, dy = event.pos[0] - last_mouse_pos[0], event.pos[1] - last_mouse_pos[1]
                 last_mouse_pos = event.pos
-                view_yaw += dx * 0.005; view_pitch += dy * 0.005
+                if dragging: view_yaw += dx * 0.005; view_pitch += dy * 0.005
+                else: pan += (dx / SCALE, -dy / SCALE, 0.0)
+            elif event.type == pygame.MOUSEWHEEL: # Zoom about the cursor
+                factor = min(max(zoom * ZOOM_STEP ** event.y, ZOOM_RANGE[0]), ZOOM_RANGE[1]) / zoom
+                mouse_x, mouse_y = pygame.mouse.get_pos()
+                cursor = np.array([(mouse_x - WIDTH * 0.5) / SCALE, (HEIGHT * 0.5 - mouse_y) / SCALE, 0.0])
+                pan, zoom = cursor - (cursor - pan) * factor, zoom * factor
 
-        screen.fill(BACKGROUND)
-        
-        for s in bg_stars: # Draw Background Stars
-            if random.random() < 0.02: s[3] = random.randint(100, 255) # Twinkle
-            b = s[3] / 255.0
-            pygame.draw.circle(screen, (int(s[4][0] * b), int(s[4][1] * b), int(s[4][2] * b)), (s[0], s[1]), s[2])
+        background.twinkle()
+        background.draw(screen)
 
-        spin_angle += ROT_SPEED * dt
+        spin_angle += ROT_SPEED * dt / zoom # Same on-screen speed at any zoom
         theta = spin_angle + BASE_AZIM
         mat = rotation_matrix_y(view_yaw) @ rotation_matrix_x(view_pitch) @ rotation_matrix_z(theta)
         
-        center = (WIDTH // 2, HEIGHT // 2)
-        for r in range(STAR_GLOW_RADIUS, 0, -5): # Glow
-            s = pygame.Surface((r*2, r*2), pygame.SRCALPHA)
-            pygame.draw.circle(s, (255, 255, 255, 15), (r, r), r)
-            screen.blit(s, (center[0]-r, center[1]-r))
-        pygame.draw.circle(screen, (255, 255, 255), center, STAR_RADIUS)
+        background.draw_glow(screen, (WIDTH // 2, HEIGHT // 2))
 
-        render_list = []
-        light_draw_queue = []
-        edge_draw_queue = []
-        for verts_local, edges, faces_local, lights_local in segments:
-            v_world = verts_local @ mat.T
-            x2d, y2d, mask_v, _ = project_points(v_world)
-            if len(x2d) == 0: continue
-            
-            for i, (face_indices, edge_flags) in enumerate(faces_local):
-                if not all(mask_v[idx] for idx in face_indices): continue
-                points_2d = [(x2d[idx], y2d[idx]) for idx in face_indices]
-                avg_z = sum(v_world[idx][2] for idx in face_indices) / len(face_indices)
-                
-                proj_lights = []
-                if lights_local[i]:
-                    pts_world = np.array([l[0] for l in lights_local[i]]) @ mat.T
-                    lx, ly, _, _ = project_points(pts_world)
-                    for j in range(len(lx)): proj_lights.append((lx[j], ly[j], lights_local[i][j][1], lights_local[i][j][2]))
-                
-                edge_flags_front = list(edge_flags)
-                render_list.append((avg_z, 'face', points_2d, FACE_EDGE_FRONT, edge_flags_front, proj_lights, False))
-                back_points = list(reversed(points_2d))
-                back_edge_flags = reverse_edge_flags(edge_flags_front)
-                render_list.append((avg_z - DOUBLE_FACE_Z_OFFSET, 'face', back_points, FACE_EDGE_BACK, back_edge_flags, proj_lights, True))
-                light_draw_queue.extend(proj_lights)
-
-        render_list.sort(key=lambda x: x[0]) # Sort by depth
-        
-        for _, type_, points, edge_color, edge_flags, lights, is_back in render_list:
-            if type_ == 'face':
-                fill_color = FACE_FILL_BACK if is_back else FACE_FILL_FRONT
-                draw_translucent_polygon(screen, points, fill_color)
-                edge_draw_queue.append((edge_color, points, edge_flags))
-
-        for edge_color, points, edge_flags in edge_draw_queue:
-            edge_count = min(len(points), len(edge_flags))
-            for k in range(edge_count):
-                if edge_flags[k]:
-                    pygame.draw.line(screen, edge_color, points[k], points[(k + 1) % len(points)], 1)
-
-        for lx, ly, lsize, lcolor in light_draw_queue:
-            pygame.draw.circle(screen, lcolor, (int(lx), int(ly)), max(1, int(lsize)))
-
-        info_text = [f"Rot X (Pitch): {math.degrees(view_pitch):.1f}°", f"Rot Y (Yaw):   {math.degrees(view_yaw):.1f}°", f"Rot Z (Spin):  {math.degrees(theta):.1f}°"]
+        pan_ring = mat.T @ pan
+        if stream is None:
+            view = view_instances(instances, zoom, pan_ring)
+            shown = np.flatnonzero(cull_segments(view, mat, bounds, light_margin))
+            level = np.full(N_SEGMENTS, -1, dtype=np.int64) # -1: culled
+            level[shown] = select_lod(take_instances(view, shown), mat, lod_arc, chain, LOD_PIXELS) if len(chain) > 1 else 0
+            frame = assemble_lod(lods, level)
+            light_level = level[light_segment]
+            lit = np.flatnonzero(light_level >= 0) # Lights of segments that survived culling
+            lit_points, lit_faces = attach_lights(lods, chain, light_level[lit], light_face[lit], light_uv[lit])
+            lit_points, lit_faces = place_points(view, lit_points, light_segment[lit]), frame.face_start[light_segment[lit]] + lit_faces
+        else: # Only what is on screen exists: proxies when zoomed out, real segments and their lights when zoomed in
+            stride, index = stream.visible(mat, zoom, pan_ring, light_margin)
+            lods, lod_arc = stream.level(stride).lods, stream.level(stride).arc
+            view, shown = stream.instances(stride, index, zoom, pan_ring), np.arange(len(index))
+            level = select_lod(view, mat, lod_arc, chain, LOD_PIXELS) if len(chain) > 1 else np.zeros(len(index), dtype=np.int64)
+            frame = assemble_lod(lods, level)
+            lit_points, lit_faces, lit_segment, sizes, colors = stream.frame_lights(view, index if stride == 1 else index[:0], level)
+            lit_faces += frame.face_start[lit_segment]
+            splatter, lit = LightSplatter(screen, sizes, colors), np.arange(len(sizes))
+            if stride == 1: stream.prefetch(index)
+        light_base = int(frame.vert_start[-1])
+        world = np.empty((light_base + len(lit), 3)) # Camera-space scene
+        transform_lod(view, lods, level, frame.vert_start, mat, world)
+        np.matmul(lit_points, mat.T, out=world[light_base:]) # Then one projection for the whole scene
+        x_all, y_all, _, scale_all = project_points(world)
+        xy_all = np.stack([x_all, y_all], axis=1)
+        face_xy, face_visible = project_faces(world, frame.faces, xy_all)
+        face_visible &= faces_on_screen(face_xy, WIDTH, HEIGHT)
+        if FACE_SIDES == 'both': back = None
+        else: back = back_facing(face_xy) if FACE_SIDES == 'facing' else np.zeros(len(face_xy), dtype=bool) # One entry per face instead of two
+        layer_back = back if FACE_SIDES == 'facing' else None # Compositors resolve a face's back and front layers exactly
+        if layouts is not None: order = lod_painter_order(mat, layouts, level, frame.face_start, back)
+        elif PROJECTION == 'perspective': # Drop clipped-away and off-screen faces before sorting
+            kept = np.flatnonzero(face_visible)
+            order = painter_order(world[:, 2], frame.faces[kept], None if back is None else back[kept])
+            order = kept[order >> 1] << 1 | order & 1
+        else: order = painter_order(world[:, 2], frame.faces, back)
+        order = order[face_visible[order >> 1]]
+        if FILL_MODE == 'coverage': # Every visible face is filled once per style it is drawn in, in any order
+            compositor.composite(screen, *side_layers(face_xy, face_visible, layer_back))
+        elif FILL_MODE == 'numpy': # One batch per segment, segments back to front
+            segment_z = np.add.reduceat(world[:light_base, 2], frame.vert_start[shown]) / np.diff(frame.vert_start)[shown]
+            for s_idx in shown[np.argsort(segment_z, kind='stable')].tolist():
+                first, last = frame.face_start[s_idx], frame.face_start[s_idx + 1]
+                compositor.composite(screen, *side_layers(face_xy[first:last], face_visible[first:last], None if layer_back is None else layer_back[first:last]))
+
+        if compositor is None:
+            fill_colors = (CoverageCompositor.merged() if FACE_SIDES == 'merged' else FACE_FILL_FRONT, FACE_FILL_BACK) # Back sides skip the winding reversal
+            for points, is_back in zip(clip_to_screen(face_xy[order >> 1]).tolist(), (order & 1).tolist()):
+                fill_polygon(screen, points, fill_colors[is_back])
+
+        edge_ids, edge_sides, edge_flips = edge_draw_list(order, frame.face_edges, frame.edge_flipped)
+        ends, edge_kept = project_edges(world, frame.edges[edge_ids], xy_all)
+        ends[edge_flips] = ends[edge_flips, ::-1]
+        edge_colors = (FACE_EDGE_FRONT, FACE_EDGE_BACK)
+        for (start, end), side in zip(ends[edge_kept].tolist(), edge_sides[edge_kept].tolist()):
+            pygame.draw.line(screen, edge_colors[side], start, end, 1)
+
+        light_x, light_y, light_scale = (np.zeros(len(splatter.sizes)) for _ in range(3))
+        light_x[lit], light_y[lit], light_scale[lit] = x_all[light_base:], y_all[light_base:], scale_all[light_base:]
+        light_visible = light_scale > 0 # The splatter clips lights to the screen by their own radius
+        light_visible[lit] &= face_visible[lit_faces]
+        splatter.splat(screen, light_x, light_y, light_visible, light_scale if PROJECTION == 'perspective' else None)
+
+        mouse = pygame.mouse.get_pos()
+        hover_light = LightGrid(light_x, light_y, light_visible, (WIDTH, HEIGHT)).nearest(*mouse, LIGHT_PICK_PIXELS)
+        if hover_light is not None: # Ring the light under the cursor; its face is reported at the finest level
+            radius = max(1, int(splatter.sizes[hover_light] * (light_scale[hover_light] if PROJECTION == 'perspective' else 1.0)))
+            pygame.draw.circle(screen, FACE_HOVER, (int(light_x[hover_light]), int(light_y[hover_light])), min(radius, LightSplatter.MAX_RADIUS) + 3, 1)
+            if stream is None: light_info = (light_segment[hover_light], light_face[hover_light])
+            else:
+                run = lit_segment[hover_light]
+                first = np.searchsorted(lit_segment, run) # Lights come in runs per visible segment
+                light_info = (index[run], stream.segment_lights(index[run:run + 1])[0].faces[hover_light - first])
+        hover = pick_segments(face_tree, instances, lods, level, mat, zoom, pan_ring, mouse) if face_tree is not None else None
+        if hover is not None: # Outline the face under the cursor, at the level its segment is drawn at
+            mesh = lods[level[hover[0]]]
+            corners = transform_instances(take_instances(view, np.array(hover[:1]), mesh), mat)[0, mesh.faces[hover[1]]]
+            x, y, _, _ = project_points(corners)
+            outline, kept = project_faces(corners, np.arange(4)[None], np.stack([x, y], axis=1))
+            if kept[0]: pygame.draw.polygon(screen, FACE_HOVER, outline[0].tolist(), 1)
+
+        info_text = [f"Rot X (Pitch): {math.degrees(view_pitch):.1f}°", f"Rot Y (Yaw):   {math.degrees(view_yaw):.1f}°", f"Rot Z (Spin):  {math.degrees(theta):.1f}°",
+                     f"Zoom:          {zoom:.3g}x"]
+        if hover is not None: info_text.append("Face:          segment %d, face %d, level %d" % (*hover[:2], level[hover[0]]))
+        if hover_light is not None: info_text.append("Light:         segment %d, face %d, size %.2f" % (*light_info, splatter.sizes[hover_light]))
+        if stream is not None: info_text.append(f"Segments:      {len(index)} x {stride} ({len(stream.lights)} lit cached)")
         for i, line in enumerate(info_text): screen.blit(font.render(line, True, (0, 255, 255)), (10, 10 + i * 20))
 
         pygame.display.flip()
+    if stream is not None: stream.close()
     pygame.quit()
 
 if __name__ == "__main__":
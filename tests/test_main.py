@@ -0,0 +1,728 @@
+import os
+import warnings
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pytest
+
+import main
+
+
+@pytest.fixture
+def segments():
+    """Two small ring segments."""
+    return [main.make_curved_beveled_segment(i * 0.5, 0.4, 1.0, 2.0, 0.5, 2) for i in range(2)]
+
+
+@pytest.fixture
+def light_store(segments):
+    return main.generate_light_store(segments, 50, np.random.default_rng(0))
+
+
+def test_light_store_csr_rows_lie_on_their_faces(segments, light_store):
+    """Every face's CSR row range holds lights inside that face's bounding box."""
+    assert light_store.positions.dtype == np.float32 and light_store.colors.dtype == np.uint8
+    assert len(light_store.positions) == len(light_store.sizes) == len(light_store.colors) == 100
+    for s_idx, mesh in enumerate(segments):
+        first, last = light_store.segment_faces[s_idx], light_store.segment_faces[s_idx + 1]
+        assert last - first == len(mesh.faces)
+        assert light_store.face_offsets[last] - light_store.face_offsets[first] == 50
+        for i, face_indices in enumerate(mesh.faces):
+            rows = light_store.positions[light_store.face_offsets[first + i]:light_store.face_offsets[first + i + 1]]
+            corners = mesh.verts[face_indices]
+            assert np.all(rows >= corners.min(axis=0) - 1e-5) and np.all(rows <= corners.max(axis=0) + 1e-5)
+
+
+def test_light_store_sizes_and_colors_in_range(light_store):
+    assert np.all((light_store.sizes >= 0.15) & (light_store.sizes <= 8.0))
+    assert np.all((light_store.colors[:, 0] >= 100) & (light_store.colors[:, 0] <= 200))
+    assert np.all(light_store.colors[:, 1:] <= 30)
+
+
+def pack_copies(copies):
+    """Per-segment mesh copies stacked the plain way: faces, edges, face_edges, edge_flipped, with indices offset."""
+    vert_offsets = np.cumsum([0] + [len(mesh.verts) for mesh in copies])
+    edge_offsets = np.cumsum([0] + [len(mesh.edges) for mesh in copies])
+    return (np.concatenate([mesh.faces + vert_offsets[i] for i, mesh in enumerate(copies)]),
+            np.concatenate([mesh.edges + vert_offsets[i] for i, mesh in enumerate(copies)]),
+            np.concatenate([np.where(mesh.face_edges >= 0, mesh.face_edges + edge_offsets[i], -1) for i, mesh in enumerate(copies)]),
+            np.concatenate([mesh.edge_flipped for mesh in copies]))
+
+
+def test_assemble_lod_offsets_slice_back_out():
+    """Instanced vertices and faces of a single-level frame slice back out per segment."""
+    mesh = main.make_curved_beveled_segment(0.0, 0.4, 1.0, 2.0, 0.5, 2)
+    instances = main.make_ring_instances(mesh, [0.0, 0.5])
+    frame = main.assemble_lod([mesh], np.zeros(2, dtype=np.int64))
+    points = main.transform_instances(instances, np.eye(3)).reshape(-1, 3)
+    assert frame.faces.shape == (2 * len(mesh.faces), 4) and frame.faces.dtype == np.int32
+    for s_idx, angle in enumerate([0.0, 0.5]):
+        np.testing.assert_allclose(points[frame.vert_start[s_idx]:frame.vert_start[s_idx + 1]], mesh.verts @ main.rotation_matrix_z(angle).T)
+        np.testing.assert_array_equal(frame.faces[frame.face_start[s_idx]:frame.face_start[s_idx + 1]], mesh.faces + frame.vert_start[s_idx])
+
+
+@pytest.mark.parametrize("kind", sorted(main.PROFILES))
+def test_profile_caps_tile_the_cross_section(kind):
+    """Cap quads cover the profile polygon exactly, and only outline edges are flagged."""
+    profile = main.PROFILES[kind](4.5, 7.5, 2.5, 0.3)
+    def area(p): return 0.5 * np.sum(p[:, 0] * np.roll(p[:, 1], -1) - np.roll(p[:, 0], -1) * p[:, 1])
+    assert area(profile.points) > 0 # Counter-clockwise
+    np.testing.assert_allclose(sum(area(profile.points[q]) for q in profile.caps), area(profile.points))
+    assert all(area(profile.points[q]) >= -1e-12 for q in profile.caps)
+    mesh = main.sweep_profile(profile, 0.0, 0.5, 3)
+    n = len(profile.points)
+    assert mesh.faces.shape == (3 * n + 2 * len(profile.caps), 4)
+    cap_edges = {tuple(sorted(e)) for e in mesh.edges.tolist() if max(e) < n}
+    assert cap_edges == {(k, (k + 1) % n) if k + 1 < n else (0, n - 1) for k in range(n)}
+
+
+def test_unbeveled_box_matches_four_point_segment():
+    mesh = main.make_curved_beveled_segment(0.3, 0.5, 4.5, 7.5, 2.5, 2, bevel=0.0)
+    assert len(mesh.verts) == 12 and len(mesh.faces) == 10
+    np.testing.assert_array_equal(mesh.faces[-2:], [[0, 1, 2, 3], [11, 10, 9, 8]])
+    assert mesh.flags[-2:].all() and mesh.flags[:8, [0, 2]].all()
+
+
+def test_segment_edges_cover_each_flagged_quad_edge_once(segments):
+    mesh = segments[0]
+    assert mesh.faces.dtype == mesh.edges.dtype == mesh.face_edges.dtype == np.int32
+    assert len(np.unique(mesh.edges, axis=0)) == len(mesh.edges)
+    np.testing.assert_array_equal(mesh.face_edges >= 0, mesh.flags)
+    for f, k in zip(*np.nonzero(mesh.flags)):
+        a, b = mesh.edges[mesh.face_edges[f, k]][::-1] if mesh.edge_flipped[f, k] else mesh.edges[mesh.face_edges[f, k]]
+        assert (a, b) == (mesh.faces[f, k], mesh.faces[f, (k + 1) % 4])
+
+
+def test_edge_draw_list_keeps_each_edges_last_entry(segments):
+    """Every edge is drawn once, with the side and direction of the last painter entry that drew it."""
+    mesh = segments[0]
+    order = np.random.default_rng(8).permutation(2 * len(mesh.faces))
+    last = {}
+    for rank, entry in enumerate(order.tolist()):
+        f_idx, is_back = entry >> 1, entry & 1
+        quad = mesh.faces[f_idx][::-1] if is_back else mesh.faces[f_idx]
+        flags = mesh.flags[f_idx][[2, 1, 0, 3]] if is_back else mesh.flags[f_idx]
+        for k in np.flatnonzero(flags):
+            a, b = int(quad[k]), int(quad[(k + 1) % 4])
+            last[(min(a, b), max(a, b))] = (rank, is_back, (a, b))
+    edge_ids, sides, flipped = main.edge_draw_list(order, mesh.face_edges, mesh.edge_flipped)
+    drawn = {tuple(mesh.edges[e].tolist()): (s, tuple(mesh.edges[e][::-1].tolist() if f else mesh.edges[e].tolist()))
+             for e, s, f in zip(edge_ids, sides.tolist(), flipped)}
+    assert len(drawn) == len(edge_ids) and drawn == {edge: (side, ends) for edge, (_, side, ends) in last.items()}
+    ranks = [last[tuple(mesh.edges[e].tolist())][0] for e in edge_ids]
+    assert ranks == sorted(ranks)
+
+
+def test_scene_cache_memory_maps_and_invalidates(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "N_SEGMENTS", 3)
+    monkeypatch.setattr(main, "RNG_SEED", 0)
+    builds = []
+    def build():
+        builds.append(1)
+        return main.build_scene()
+    (tmp_path / "precious").mkdir()
+    (tmp_path / "precious" / "notes.txt").write_text("keep")
+    (tmp_path / ".staging-crashed").mkdir() # Left behind by an interrupted write
+    fresh = main.load_or_build(str(tmp_path), main.scene_config(), build)
+    cached = main.load_or_build(str(tmp_path), main.scene_config(), build)
+    assert len(builds) == 1 and isinstance(cached["lights_uv"], np.memmap)
+    assert cached.keys() == fresh.keys()
+    for name in fresh: np.testing.assert_array_equal(cached[name], fresh[name])
+    monkeypatch.setattr(main, "LIGHTS_PER_SEGMENT", 7)
+    rebuilt = main.load_or_build(str(tmp_path), main.scene_config(), build)
+    assert len(builds) == 2 and len(rebuilt["lights_sizes"]) == 21
+    names = sorted(path.name for path in tmp_path.iterdir())
+    assert names[1:] == ["precious"] and main.CACHE_ENTRY.fullmatch(names[0]) # The stale entry and staging are gone
+    assert (tmp_path / "precious" / "notes.txt").read_text() == "keep"
+
+
+def test_painter_order_matches_tuple_sort():
+    """The argsort order matches the old stable sort over (front, back) render tuples."""
+    rng = np.random.default_rng(1)
+    depth = rng.normal(size=40)
+    faces = rng.integers(0, 40, size=(25, 4))
+    render_list = []
+    for f_idx, face in enumerate(faces):
+        avg_z = sum(depth[idx] for idx in face) / 4
+        render_list += [(avg_z, 2 * f_idx), (avg_z - main.DOUBLE_FACE_Z_OFFSET, 2 * f_idx + 1)]
+    render_list.sort(key=lambda x: x[0])
+    np.testing.assert_array_equal(main.painter_order(depth, faces), [entry for _, entry in render_list])
+
+
+def analytic_ring():
+    """Six instances of one segment, their single-level frame and ring layout, for the analytic painter order."""
+    angles = [0.3 + 2 * np.pi * i / 6 for i in range(6)]
+    instances = main.make_ring_instances(main.make_curved_beveled_segment(0.0, 0.8, 4.5, 7.5, 2.5, 3), angles)
+    return instances, main.assemble_lod([instances.mesh], np.zeros(6, dtype=np.int64)), main.instance_layout(instances)
+
+
+def test_analytic_order_matches_centroid_depths():
+    """Segments come out back to front and each segment's faces in centroid-depth order."""
+    instances, frame, layout = analytic_ring()
+    assert layout is not None
+    mat = main.rotation_matrix_y(0.7) @ main.rotation_matrix_x(0.6) @ main.rotation_matrix_z(1.1)
+    order = main.lod_painter_order(mat, [layout], np.zeros(6, dtype=np.int64), frame.face_start)
+    assert sorted(order.tolist()) == list(range(2 * len(frame.faces)))
+    keys = main.painter_depths(main.transform_instances(instances, mat).reshape(-1, 3)[:, 2], frame.faces)[order]
+    f_seg = len(layout.radius)
+    seg_keys = keys.reshape(len(layout.angles), 2 * f_seg)
+    assert np.all(np.diff(seg_keys, axis=1) >= -main.DOUBLE_FACE_Z_OFFSET - 1e-9)
+    assert np.all(np.diff(seg_keys.mean(axis=1)) >= 0)
+
+
+@pytest.mark.parametrize("projection", ["orthographic", "perspective"])
+def test_back_facing_matches_normals(monkeypatch, projection):
+    """The screen winding test agrees with each quad's outward normal against the view direction."""
+    monkeypatch.setattr(main, "PROJECTION", projection)
+    mesh = main.make_curved_beveled_segment(0.0, 0.8, 4.5, 7.5, 2.5, 4)
+    instances = main.make_ring_instances(mesh, np.linspace(0.0, 2 * np.pi, 6, endpoint=False))
+    mat = main.rotation_matrix_y(0.7) @ main.rotation_matrix_x(0.6) @ main.rotation_matrix_z(1.1)
+    world = main.transform_instances(instances, mat).reshape(-1, 3)
+    faces = (mesh.faces + len(mesh.verts) * np.arange(6)[:, None, None]).reshape(-1, 4)
+    x, y, _, _ = main.project_points(world)
+    face_xy, kept = main.project_faces(world, faces, np.stack([x, y], axis=1))
+    corners = world[faces]
+    normal = np.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 1])
+    eye = np.array([0.0, 0.0, main.CAMERA_DISTANCE]) - corners.mean(axis=1) if projection == "perspective" else np.array([0.0, 0.0, 1.0])
+    toward = np.sum(normal * eye, axis=1)
+    clear = kept & (np.abs(toward) > 1e-6 * np.linalg.norm(normal, axis=1) * np.linalg.norm(np.broadcast_to(eye, normal.shape), axis=1))
+    np.testing.assert_array_equal(main.back_facing(face_xy)[clear], toward[clear] < 0)
+
+
+def test_single_sided_orders_keep_the_shown_side():
+    """With back-facing flags every sort emits each face once, in the double-sided order minus the hidden sides."""
+    instances, frame, layout = analytic_ring()
+    faces = frame.faces
+    mat = main.rotation_matrix_y(0.7) @ main.rotation_matrix_x(0.6) @ main.rotation_matrix_z(1.1)
+    depth = main.transform_instances(instances, mat).reshape(-1, 3)[:, 2]
+    back = np.random.default_rng(3).random(len(faces)) < 0.5
+    sorts = [lambda b: main.painter_order(depth, faces, b),
+             lambda b: main.lod_painter_order(mat, [layout], np.zeros(6, dtype=np.int64), frame.face_start, b)]
+    for sort in sorts:
+        double, single = sort(None), sort(back)
+        assert len(single) == len(faces)
+        np.testing.assert_array_equal(single, double[(double & 1) == back[double >> 1]])
+
+
+def test_twist_rolls_the_cross_section_and_keeps_winding():
+    """A half twist over the ring turns the box profile a quarter turn at the midpoint, and every quad keeps
+    facing away from the profile's centre line."""
+    mesh = main.make_curved_beveled_segment(0.0, 0.4, 4.5, 7.5, 1.0, 4, bevel=0.0)
+    flat = main.make_ring_instances(mesh, [0.0, np.pi / 2])
+    twisted = main.make_ring_instances(mesh, [0.0, np.pi / 2], twist=0.5, twist_radius=6.0)
+    verts = main.transform_instances(twisted, np.eye(3))
+    mid = verts[1, 2 * 4:3 * 4] # Ring at the second instance's centre, rolled by 0.5 * pi / 2
+    c, s = np.cos(np.pi / 4), np.sin(np.pi / 4)
+    profile = np.array([[-1.5, -0.5], [1.5, -0.5], [1.5, 0.5], [-1.5, 0.5]]) @ np.array([[c, s], [-s, c]])
+    np.testing.assert_allclose(np.stack([np.hypot(mid[:, 0], mid[:, 1]) - 6.0, mid[:, 2]], axis=1), profile, atol=1e-12)
+    for instances in (flat, twisted):
+        v = main.transform_instances(instances, np.eye(3))
+        for n in range(2):
+            quads = v[n][mesh.faces[:-2]]
+            normal = np.cross(quads[:, 2] - quads[:, 0], quads[:, 3] - quads[:, 1])
+            centre = quads.mean(axis=1)
+            axis = centre * [1, 1, 0]
+            axis *= 6.0 / np.linalg.norm(axis, axis=1, keepdims=True)
+            assert np.all(np.einsum('ij,ij->i', normal, centre - axis) > 0) # Outward winding everywhere
+    assert main.instance_layout(twisted) is None
+
+
+def test_faces_on_screen_keeps_faces_spanning_the_viewport():
+    quads = np.array([[[-50, -50], [150, -50], [150, 150], [-50, 150]],  # Covers the screen, no corner inside
+                      [[10, 10], [20, 10], [20, 20], [10, 20]],          # Inside
+                      [[120, 10], [130, 10], [130, 20], [120, 20]],      # Right of the screen
+                      [[-5, 40], [5, 40], [5, 50], [-5, 50]]], float)    # Straddles the left edge
+    assert main.faces_on_screen(quads, 100, 100).tolist() == [True, True, False, True]
+    _, _, mask, _ = main.project_points(np.array([[0.0, 0.0, 0.0], [100.0, 0.0, 0.0]]))
+    assert mask.tolist() == [True, False]
+
+
+def test_perspective_projection_scales_by_distance(monkeypatch):
+    """Perspective frames the ring centre plane like the orthographic SCALE, grows nearer points and drops
+    points behind the near plane."""
+    monkeypatch.setattr(main, "PROJECTION", "perspective")
+    points = np.array([[1.0, 1.0, 0.0], [1.0, 1.0, main.CAMERA_DISTANCE / 2], [0.0, 0.0, main.CAMERA_DISTANCE]])
+    x, y, mask, scale = main.project_points(points)
+    assert scale[0] == pytest.approx(1.0) and scale[1] == pytest.approx(2.0) and scale[2] == 0.0
+    assert x[0] - main.WIDTH / 2 == pytest.approx(main.SCALE) and main.HEIGHT / 2 - y[1] == pytest.approx(2 * main.SCALE)
+    assert mask.tolist() == [True, True, False]
+
+
+def test_clip_near_plane(monkeypatch):
+    """Quads crossing the near plane are cut at it (one corner behind leaves a pentagon), wholly hidden ones
+    and segments are handled by the same vectorized pass."""
+    monkeypatch.setattr(main, "CAMERA_DISTANCE", 10.0)
+    monkeypatch.setattr(main, "NEAR_PLANE", 1.0) # Visible side: z <= 9
+    quads = np.array([[[0, 0, 8], [1, 0, 8], [1, 0, 10], [0, 0, 10]],      # Half behind
+                      [[0, 0, 8], [2, 0, 8], [2, 0, 10], [0, 0, 8.5]],     # One corner behind
+                      [[0, 0, 9.5], [1, 0, 9.5], [1, 1, 9.5], [0, 1, 9.5]], # Wholly behind
+                      [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]]], float) # Wholly visible
+    clipped, count = main.clip_near_plane(quads)
+    assert clipped.shape == (4, 5, 3) and count.tolist() == [4, 5, 0, 4]
+    assert np.all(clipped[[0, 1, 3], :, 2] <= 9 + 1e-12)
+    np.testing.assert_allclose(clipped[0, :4], [[0, 0, 8], [1, 0, 8], [1, 0, 9], [0, 0, 9]])
+    np.testing.assert_allclose(clipped[3], quads[3][[0, 1, 2, 3, 3]])
+    segment, count = main.clip_near_plane(np.array([[[0.0, 0, 8], [0, 2, 12]], [[0.0, 0, 12], [0, 2, 8]]]))
+    np.testing.assert_allclose(segment[:, :2], [[[0, 0, 8], [0, 0.5, 9]], [[0, 1.5, 9], [0, 2, 8]]])
+
+
+def test_clip_to_screen_keeps_visible_pixels():
+    """Polygons far beyond SDL_gfx's 16-bit range are cut to the guard band and cover the same pixels."""
+    polygons = np.array([[[100, 100], [40000, 300], [200, 800], [150, 500]],  # Far off to the right
+                         [[-5e5, -5e5], [5e5, -5e5], [5e5, 5e5], [-5e5, 5e5]], # Covers the whole screen
+                         [[-9e4, 50], [-8e4, 50], [-8e4, 60], [-9e4, 60]],     # Wholly outside
+                         [[10, 10], [60, 10], [60, 60], [10, 60]]], float)     # Untouched
+    clipped = main.clip_to_screen(polygons)
+    assert clipped.shape == (4, 8, 2) and np.all(np.abs(clipped - [main.WIDTH / 2, main.HEIGHT / 2]) <= [main.WIDTH / 2 + 16, main.HEIGHT / 2 + 16])
+    np.testing.assert_array_equal(main.CoverageCompositor.coverage(clipped, main.WIDTH, main.HEIGHT),
+                                  main.CoverageCompositor.coverage(polygons, main.WIDTH, main.HEIGHT))
+    inside = polygons[3:]
+    assert main.clip_to_screen(inside) is inside
+
+
+@pytest.mark.parametrize("twist, projection", [(0.0, "orthographic"), (0.5, "orthographic"), (0.5, "perspective")])
+def test_cull_segments_is_conservative(monkeypatch, twist, projection):
+    """A culled segment never has a face on screen, and zooming in (or flying in) culls most of the ring."""
+    monkeypatch.setattr(main, "SCALE", 400.0)
+    monkeypatch.setattr(main, "PROJECTION", projection)
+    monkeypatch.setattr(main, "CAMERA_DISTANCE", 2.0)
+    mesh = main.make_curved_beveled_segment(0.0, 0.4, 4.5, 7.5, 2.5, 4)
+    instances = main.make_ring_instances(mesh, np.linspace(0, 2 * np.pi, 24, endpoint=False), twist=twist, twist_radius=6.0)
+    mat = main.rotation_matrix_x(0.6) @ main.rotation_matrix_z(0.3)
+    world = main.transform_instances(instances, mat)
+    bounds = main.segment_bounds(instances)
+    for n in range(24): # Every rolled vertex lies inside the segment-local sphere
+        local = (world[n] @ mat) @ main.rotation_matrix_z(instances.angles[n])
+        assert np.all(np.linalg.norm(local - bounds[0], axis=1) <= bounds[1] + 1e-9)
+    x, y, _, _ = main.project_points(world.reshape(-1, 3))
+    xy = np.stack([x, y], axis=1).reshape(24, -1, 2)
+    on_screen = []
+    for camera, screen in zip(world, xy):
+        face_xy, kept = main.project_faces(camera, mesh.faces, screen)
+        on_screen.append((kept & main.faces_on_screen(face_xy, main.WIDTH, main.HEIGHT)).any())
+    on_screen = np.array(on_screen)
+    shown = main.cull_segments(instances, mat, bounds)
+    assert np.all(shown[on_screen]) and shown.sum() < 24
+
+
+@pytest.mark.parametrize("twist, projection", [(0.0, "orthographic"), (0.5, "orthographic"), (0.0, "perspective")])
+def test_cull_boxes_is_conservative_and_tight(monkeypatch, twist, projection):
+    """Arc boxes never cull an instance that draws a pixel, and drop thin segments that spheres keep."""
+    monkeypatch.setattr(main, "PROJECTION", projection)
+    monkeypatch.setattr(main, "CAMERA_DISTANCE", 3.0)
+    span, profile = 0.05, main.box_profile(4.5, 7.5, 2.5, 0.15)
+    mesh = main.sweep_profile(profile, 0.0, span, 4)
+    instances = main.make_ring_instances(mesh, np.linspace(0, 2 * np.pi, 120, endpoint=False), twist=twist, twist_radius=6.0)
+    zoom, mat = 30.0, main.rotation_matrix_x(0.3) @ main.rotation_matrix_z(0.2)
+    view = main.view_instances(instances, zoom, -zoom * mat.T @ (mat @ [6.0, 0.5, 0.0])) # Zoomed onto the ring
+    world = main.transform_instances(view, mat)
+    x, y, _, _ = main.project_points(world.reshape(-1, 3))
+    xy = np.stack([x, y], axis=1).reshape(len(world), -1, 2)
+    on_screen, canvas = [], main.pygame.Surface((main.WIDTH, main.HEIGHT))
+    for camera, screen in zip(world, xy): # Rasterize: the bounding-box face test is not exact for long thin faces
+        face_xy, kept = main.project_faces(camera, mesh.faces, screen)
+        polygons = face_xy[kept & main.faces_on_screen(face_xy, main.WIDTH, main.HEIGHT)].tolist()
+        canvas.fill((0, 0, 0))
+        for polygon in polygons: main.pygame.draw.polygon(canvas, (255, 255, 255), polygon)
+        on_screen.append(bool(polygons) and main.pygame.surfarray.array2d(canvas).any())
+    shown = main.cull_boxes(view, mat, main.arc_box(profile.points, span, 6.0 if twist else None))
+    assert np.all(shown[on_screen]) and shown.sum() < main.cull_segments(view, mat, main.segment_bounds(view)).sum()
+
+
+@pytest.fixture
+def ring_bvh():
+    """Ring-frame vertices and quads of a twisted 12-segment ring, and a FaceBVH over them."""
+    mesh = main.make_curved_beveled_segment(0.0, 0.4, 4.5, 7.5, 2.5, 4)
+    instances = main.make_ring_instances(mesh, np.linspace(0, 2 * np.pi, 12, endpoint=False), twist=0.3, twist_radius=6.0)
+    verts = main.transform_instances(instances, np.eye(3)).reshape(-1, 3)
+    faces = (mesh.faces + len(mesh.verts) * np.arange(12)[:, None, None]).reshape(-1, 4)
+    return verts, faces, main.FaceBVH(verts, faces)
+
+
+@pytest.mark.parametrize("projection", ["orthographic", "perspective"])
+def test_bvh_queries_match_linear_scans(monkeypatch, ring_bvh, projection):
+    """Picking finds the nearest quad a brute-force ray cast finds, on a ray through the pixel; culling keeps
+    exactly the faces whose own boxes pass boxes_on_screen."""
+    monkeypatch.setattr(main, "PROJECTION", projection)
+    verts, faces, bvh = ring_bvh
+    rng, hits = np.random.default_rng(4), 0
+    for _ in range(60):
+        mat = main.rotation_matrix_y(rng.uniform(-1, 1)) @ main.rotation_matrix_x(rng.uniform(-1, 1)) @ main.rotation_matrix_z(rng.uniform(0, 6))
+        zoom, pan = rng.choice([1.0, 4.0]), rng.normal(size=3) * 2
+        x, y, _, _ = main.project_points((mat @ (zoom * verts[rng.integers(len(verts))] + pan))[None]) # Near the ring, mostly
+        pos = (x[0] + rng.normal() * 20, y[0] + rng.normal() * 20)
+        origin, direction, t_min = main.view_ray(mat, zoom, pan, pos)
+        t = main.ray_quads(origin, direction, verts[faces])
+        t[t < t_min] = np.inf
+        picked = bvh.pick(mat, zoom, pan, pos)
+        assert (picked is None) == np.isinf(t.min())
+        if picked is not None:
+            hits += 1
+            assert picked == (int(np.argmin(t)), t.min())
+            x, y, _, _ = main.project_points((mat @ (zoom * (origin + t.min() * direction) + pan))[None])
+            np.testing.assert_allclose([x[0], y[0]], pos, atol=1e-6)
+        combined = np.broadcast_to(zoom * mat, (len(faces), 3, 3))
+        corners = verts[faces]
+        expected = main.boxes_on_screen(combined, np.broadcast_to(mat @ pan, (len(faces), 3)), corners.min(axis=1), corners.max(axis=1))
+        np.testing.assert_array_equal(np.sort(bvh.cull(mat, zoom, pan)), np.flatnonzero(expected))
+    assert hits > 10
+
+
+@pytest.mark.parametrize("projection", ["orthographic", "perspective"])
+def test_segment_tree_picks_the_drawn_level(monkeypatch, projection):
+    """Picking through the per-segment tree finds the nearest quad a brute-force ray cast finds over every
+    segment's faces at the level it is drawn at, skipping culled segments."""
+    monkeypatch.setattr(main, "PROJECTION", projection)
+    lods = [main.make_curved_beveled_segment(0.0, 0.4, 4.5, 7.5, 2.5, s) for s in (1, 2, 4)]
+    instances = main.make_ring_instances(lods[-1], np.linspace(0, 2 * np.pi, 12, endpoint=False), twist=0.3, twist_radius=6.0)
+    tree = main.segment_tree(instances, main.segment_bounds(instances))
+    rng, hits = np.random.default_rng(6), 0
+    for _ in range(60):
+        level = rng.integers(-1, 3, 12)
+        corners = [main.transform_instances(main.take_instances(instances, np.array([n]), lods[l]), np.eye(3))[0, lods[l].faces] if l >= 0 else np.zeros((0, 4, 3))
+                   for n, l in enumerate(level)]
+        mat = main.rotation_matrix_y(rng.uniform(-1, 1)) @ main.rotation_matrix_x(rng.uniform(-1, 1)) @ main.rotation_matrix_z(rng.uniform(0, 6))
+        zoom, pan = rng.choice([1.0, 4.0]), rng.normal(size=3) * 2
+        x, y, _, _ = main.project_points((mat @ (zoom * corners[int(np.argmax(level))][0, 0] + pan))[None]) # Near the ring, mostly
+        pos = (x[0] + rng.normal() * 20, y[0] + rng.normal() * 20)
+        origin, direction, t_min = main.view_ray(mat, zoom, pan, pos)
+        t = main.ray_quads(origin, direction, np.concatenate(corners))
+        t[t < t_min] = np.inf
+        picked = main.pick_segments(tree, instances, lods, level, mat, zoom, pan, pos)
+        assert (picked is None) == (not len(t) or np.isinf(t.min()))
+        if picked is not None:
+            hits += 1
+            segment, face, hit_t = picked
+            assert hit_t == pytest.approx(t.min()) and level[segment] >= 0
+            assert t[sum(len(c) for c in corners[:segment]) + face] == pytest.approx(t.min()) # Ties on shared edges may pick either
+    assert hits > 10
+
+
+def test_bvh_refit_and_back_to_front(ring_bvh):
+    """Refit boxes every node's faces after the ring moves; the coarse order lists every face once with its
+    subtrees back to front."""
+    verts, faces, bvh = ring_bvh
+    moved = verts * [1.0, 2.0, 0.5] + [0.0, 0.0, 3.0]
+    bvh.refit(moved)
+    for node in (1, 2, 5, bvh.n_leaves + 3):
+        first = node << (bvh.n_leaves.bit_length() - node.bit_length())
+        span = 1 << (bvh.n_leaves.bit_length() - node.bit_length())
+        corners = moved[faces[bvh.leaf_faces(np.arange(first, first + span) - bvh.n_leaves)]]
+        assert np.all(bvh.lo[node] <= corners.min(axis=(0, 1))) and np.all(bvh.hi[node] >= corners.max(axis=(0, 1)))
+    mat = main.rotation_matrix_x(0.6) @ main.rotation_matrix_z(0.4)
+    order = bvh.back_to_front(mat, 3)
+    assert sorted(order.tolist()) == list(range(len(faces)))
+    leaf_of = np.empty(len(faces), dtype=np.int64)
+    filled = bvh.slots >= 0
+    leaf_of[bvh.slots[filled]] = np.nonzero(filled)[0]
+    ancestor = (leaf_of[order] + bvh.n_leaves) >> (bvh.n_leaves.bit_length() - 4) # Ancestor 3 levels below the root
+    centre_z = (bvh.lo[ancestor] + bvh.hi[ancestor]) @ mat[2]
+    assert np.all(np.diff(centre_z) >= 0)
+
+
+def test_segment_stream_bounds_work_and_memory(monkeypatch):
+    """Zoomed out a huge ring draws a budget of proxies; zoomed in, real segments whose lights are generated
+    on demand, prefetched along the arc, evicted least recently used and regenerated identically.
+    Panned wholly off screen, nothing is drawn in either projection."""
+    stream = main.SegmentStream(1_000_000, 32, 64, 4, seed=0)
+    try:
+        for projection in ("perspective", "orthographic"):
+            monkeypatch.setattr(main, "PROJECTION", projection)
+            stride, index = stream.visible(np.eye(3), 1.0, np.array([1e4, 0, 0]))
+            assert len(index) == 0
+        stride, index = stream.visible(main.rotation_matrix_x(0.6))
+        assert stride > 1 and 0 < len(index) <= 32
+        point = np.array([6 * np.cos(0.3), 6 * np.sin(0.3), 0.0])
+        zoom = 3e4
+        stride, index = stream.visible(np.eye(3), zoom, -zoom * point)
+        assert stride == 1 and 0 < len(index) <= 32
+        angles = stream.instances(1, index).angles
+        assert np.all(np.abs(angles - 0.3) < 1e-3)
+        view = stream.instances(1, index, zoom, -zoom * point)
+        points, faces, segment, sizes, colors = stream.frame_lights(view, index, np.zeros(len(index), dtype=np.int64))
+        assert len(points) == len(faces) == len(sizes) == len(colors) == len(index) * main.LIGHTS_PER_SEGMENT
+        fine = stream.level(1).lods[-1]
+        store = main.generate_light_store([fine], main.LIGHTS_PER_SEGMENT, np.random.default_rng([stream.seed, index[0]]))
+        unzoomed = stream.instances(1, index)
+        points, faces, segment, _, _ = stream.frame_lights(unzoomed, index, np.full(len(index), len(main.lod_chain()) - 1))
+        np.testing.assert_allclose(points[segment == 0], main.place_points(unzoomed, store.positions, np.zeros(main.LIGHTS_PER_SEGMENT, dtype=np.int64)), atol=1e-5)
+        first = stream.segment_lights(index[:1])[0]
+        stream.prefetch(index).result()
+        assert index[0] - 1 in stream.lights and index[-1] + 4 in stream.lights
+        stream.segment_lights(np.arange(100, 200)) # Evicts everything
+        assert len(stream.lights) == 64 and index[0] not in stream.lights
+        again = stream.segment_lights(index[:1])[0]
+        np.testing.assert_array_equal(again.uv, first.uv)
+        np.testing.assert_array_equal(again.faces, first.faces)
+    finally:
+        stream.close()
+
+
+def test_lod_frame_orders_and_packs_mixed_levels():
+    """Segments at different levels pack like per-segment copies and order faces within each segment by depth."""
+    chain = (1, 2, 4)
+    lods = [main.make_curved_beveled_segment(0.0, 0.8, 4.5, 7.5, 2.5, s) for s in chain]
+    angles = [0.3 + 2 * np.pi * i / 6 for i in range(6)]
+    level = np.array([0, 2, 1, 2, 0, 1])
+    instances = main.make_ring_instances(lods[-1], angles)
+    frame = main.assemble_lod(lods, level)
+    for got, want in zip((frame.faces, frame.edges, frame.face_edges, frame.edge_flipped), pack_copies([lods[l] for l in level])):
+        np.testing.assert_array_equal(got, want)
+    mat = main.rotation_matrix_y(0.7) @ main.rotation_matrix_x(0.6) @ main.rotation_matrix_z(1.1)
+    world = np.empty((frame.vert_start[-1], 3))
+    main.transform_lod(instances, lods, level, frame.vert_start, mat, world)
+    np.testing.assert_allclose(world, np.concatenate([main.transform_instances(main.make_ring_instances(lods[l], [a]), mat)[0] for l, a in zip(level, angles)]))
+    layouts = [main.instance_layout(instances._replace(mesh=mesh)) for mesh in lods]
+    order = main.lod_painter_order(mat, layouts, level, frame.face_start)
+    assert sorted(order.tolist()) == list(range(2 * len(frame.faces)))
+    keys = main.painter_depths(world[:, 2], frame.faces)[order]
+    seg_of = np.searchsorted(frame.face_start, order >> 1, side='right') - 1
+    assert np.count_nonzero(np.diff(seg_of)) == 5 # Each segment's entries are contiguous
+    same = np.diff(seg_of) == 0
+    assert np.all(np.diff(keys)[same] >= -main.DOUBLE_FACE_Z_OFFSET - 1e-9)
+
+
+def test_lod_lights_stay_on_their_faces():
+    fine, coarse = (main.make_curved_beveled_segment(0.0, 0.8, 4.5, 7.5, 2.5, s) for s in (4, 1))
+    store = main.generate_light_store([fine, fine], 40, np.random.default_rng(9))
+    segment, face = main.store_faces(store.face_offsets, store.segment_faces)
+    assert segment.tolist() == [0] * 40 + [1] * 40 and face.max() < len(fine.faces)
+    positions, faces = main.lod_lights(face, store.uv, 4, fine, 4)
+    np.testing.assert_allclose(positions, store.positions, atol=1e-5)
+    positions, faces = main.lod_lights(face, store.uv, 4, coarse, 1)
+    assert faces.max() < len(coarse.faces)
+    corners = coarse.verts[coarse.faces[faces]]
+    assert np.all(positions >= corners.min(axis=1) - 1e-5) and np.all(positions <= corners.max(axis=1) + 1e-5)
+    level = np.arange(80) % 2 # Mixed levels land where each level's own re-attachment puts them
+    mixed, mixed_faces = main.attach_lights([coarse, fine], (1, 4), level, face, store.uv)
+    np.testing.assert_array_equal(mixed[level == 0], positions[level == 0])
+    np.testing.assert_array_equal(mixed_faces[level == 1], face[level == 1])
+
+
+def test_lights_spread_evenly_over_face_area():
+    """Light density per unit area is the same on caps, walls and thin bevel strips."""
+    mesh = main.make_curved_beveled_segment(0.0, 0.8, 4.5, 7.5, 2.5, 2)
+    store = main.generate_light_store([mesh], 200_000, np.random.default_rng(5))
+    corners = mesh.verts[mesh.faces]
+    area = 0.5 * np.linalg.norm(np.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 1]), axis=1)
+    density = np.diff(store.face_offsets) / (area / area.sum() * 200_000)
+    assert area.min() < 0.1 * area.max() # Bevels are thin next to the caps
+    np.testing.assert_allclose(density, 1.0, atol=0.1)
+
+
+def test_select_lod_follows_projected_arc():
+    chain = (1, 2, 4, 8, 16)
+    mesh = main.make_curved_beveled_segment(0.0, 0.5, 4.5, 7.5, 2.5, 16)
+    arc = mesh.verts.reshape(17, -1, 3).mean(axis=1)
+    instances = main.make_ring_instances(mesh, [0.0, np.pi / 2])
+    face_on = main.select_lod(instances, np.eye(3), arc, chain, 24)
+    assert face_on.tolist() == [3, 3] # ~158px of arc -> 7 subdivisions -> 8
+    edge_on = main.select_lod(instances, main.rotation_matrix_x(np.pi / 2), arc, chain, 24)
+    assert edge_on[0] < face_on[0] and edge_on[1] == face_on[1] # Segment 0 runs along Y, which now points at the camera
+
+
+def test_instances_match_per_segment_copies():
+    """Instanced vertices and lights land where full per-segment copies put them."""
+    angles = [0.3, 1.4, 2.9]
+    segs = [main.make_curved_beveled_segment(a, 0.8, 4.5, 7.5, 2.5, 3) for a in angles]
+    canonical = main.make_curved_beveled_segment(0.0, 0.8, 4.5, 7.5, 2.5, 3)
+    instances = main.make_ring_instances(canonical, angles)
+    mat = main.rotation_matrix_x(0.7) @ main.rotation_matrix_z(0.2)
+    np.testing.assert_allclose(main.transform_instances(instances, mat), np.stack([mesh.verts for mesh in segs]) @ mat.T, atol=1e-9)
+    store = main.generate_light_store([canonical] * 3, 20, np.random.default_rng(0))
+    placed = main.place_points(instances, store.positions, np.repeat(np.arange(3), 20))
+    np.testing.assert_allclose(placed, main.generate_light_store(segs, 20, np.random.default_rng(0)).positions, atol=1e-5)
+    layout = main.instance_layout(instances)
+    for mesh, angle in zip(segs, angles): # Every copy's face centroids at the layout's (radius, angle, height)
+        c = mesh.verts[mesh.faces].mean(axis=1)
+        np.testing.assert_allclose(np.stack([np.hypot(c[:, 0], c[:, 1]), c[:, 2]]), [layout.radius, layout.height], atol=1e-9)
+        np.testing.assert_allclose(np.cos(np.arctan2(c[:, 1], c[:, 0]) - angle - layout.offset), 1.0, atol=1e-9)
+
+
+def test_instance_scale_and_offset():
+    canonical = main.make_curved_beveled_segment(0.0, 0.8, 4.5, 7.5, 2.5, 3)
+    instances = main.make_ring_instances(canonical, [0.5], scale=2.0, offset=[1.0, 2.0, 3.0])
+    expected = 2.0 * canonical.verts @ main.rotation_matrix_z(0.5).T + [1.0, 2.0, 3.0]
+    np.testing.assert_allclose(main.transform_instances(instances, np.eye(3))[0], expected)
+    assert main.instance_layout(instances) is None
+    assert main.instance_layout(main.make_ring_instances(canonical, [0.5], twist=0.5, twist_radius=6.0)) is None
+
+
+def test_translucent_filler_matches_temporary_surface_fill():
+    """Direct blended fills match the per-face temporary Surface path within rounding and edge tolerance."""
+    rng = np.random.default_rng(3)
+    polys = []
+    for cx, cy, r in zip(rng.uniform(40, 120, 20), rng.uniform(40, 120, 20), rng.uniform(10, 35, 20)):
+        angles = np.sort(rng.uniform(0, 2 * np.pi, 4))
+        polys.append(list(zip(cx + r * np.cos(angles), cy + r * np.sin(angles))))
+    reference, blended = (main.pygame.Surface((160, 160)) for _ in range(2))
+    surfaces, filler = main.SurfaceFiller(), main.TranslucentFiller()
+    for i, points in enumerate(polys):
+        color = main.FACE_FILL_BACK if i % 2 else main.FACE_FILL_FRONT
+        surfaces.fill(reference, points, color)
+        filler.fill(blended, points, color)
+    diff = np.abs(main.pygame.surfarray.array3d(reference).astype(int) - main.pygame.surfarray.array3d(blended)).max(axis=2)
+    assert np.mean(diff <= 4) > 0.97
+    assert surfaces.allocations == surfaces.polygons == filler.polygons == 20 and filler.fill_time > 0
+
+
+def test_coverage_counts_overlapping_polygons():
+    """Coverage counts every pixel centre inside each polygon once, whatever the winding."""
+    square = np.array([[2.0, 2.0], [8.0, 2.0], [8.0, 8.0], [2.0, 8.0]])
+    counts = main.CoverageCompositor.coverage(np.stack([square, square[::-1] + 3.0]), 16, 12)
+    assert counts.shape == (16, 12)
+    assert counts[2, 2] == 1 and counts[7, 7] == 0 + 1 + 1 and counts[10, 10] == 1
+    assert counts[1, 1] == 0 and counts[11, 11] == 0 and counts.sum() == 36 + 36
+
+
+@pytest.mark.parametrize("backend", [main.CoverageCompositor, main.NumpyRasterizer])
+def test_coverage_compositor_matches_painter_fills(backend):
+    """Resolving layer counts matches painting each face's back then front fill, in any order."""
+    rng = np.random.default_rng(4)
+    polys = []
+    for cx, cy, r in zip(rng.uniform(40, 120, 25), rng.uniform(40, 120, 25), rng.uniform(10, 35, 25)):
+        angles = np.sort(rng.uniform(0, 2 * np.pi, 4))
+        polys.append(np.stack([cx + r * np.cos(angles), cy + r * np.sin(angles)], axis=1))
+    polys = np.array(polys)
+    reference, composited = (main.pygame.Surface((160, 160)) for _ in range(2))
+    for surface in (reference, composited): surface.fill((30, 60, 90))
+    for points in polys.tolist():
+        main.draw_translucent_polygon(reference, points[::-1], main.FACE_FILL_BACK)
+        main.draw_translucent_polygon(reference, points, main.FACE_FILL_FRONT)
+    backend().composite(composited, polys, polys)
+    diff = np.abs(main.pygame.surfarray.array3d(reference).astype(int) - main.pygame.surfarray.array3d(composited)).max(axis=2)
+    assert np.median(diff) <= 1 and np.mean(diff <= 6) > 0.95 # Outliers are polygon-edge rasterization
+
+
+@pytest.mark.parametrize("fill", [main.TranslucentFiller().fill, main.draw_translucent_polygon])
+def test_merged_fill_matches_back_then_front(fill):
+    """One fill in the merged colour looks like the back fill then the front fill, up to 8-bit rounding."""
+    points = [(4.0, 3.0), (60.0, 8.0), (52.0, 40.0), (9.0, 33.0)]
+    reference, merged = (main.pygame.Surface((64, 48)) for _ in range(2))
+    for surface in (reference, merged):
+        pixels = main.pygame.surfarray.pixels3d(surface)
+        pixels[...] = np.arange(64 * 48 * 3).reshape(64, 48, 3) % 256 # Every background level
+        del pixels
+    fill(reference, points, main.FACE_FILL_BACK)
+    fill(reference, points, main.FACE_FILL_FRONT)
+    fill(merged, points, main.CoverageCompositor.merged())
+    diff = np.abs(main.pygame.surfarray.array3d(reference).astype(int) - main.pygame.surfarray.array3d(merged))
+    assert diff.max() <= 1
+
+
+def test_numpy_rasterizer_writes_alpha_for_srcalpha_targets():
+    square = np.array([[[2.0, 2.0], [8.0, 2.0], [8.0, 8.0], [2.0, 8.0]]])
+    layer = main.pygame.Surface((10, 10), main.pygame.SRCALPHA)
+    main.NumpyRasterizer().composite(layer, square, square)
+    alpha = main.pygame.surfarray.array_alpha(layer)
+    a_back, a_front = main.FACE_FILL_BACK[3] / 255, main.FACE_FILL_FRONT[3] / 255
+    assert alpha[5, 5] == pytest.approx(255 * (1 - (1 - a_back) * (1 - a_front)), abs=1)
+    assert alpha[0, 0] == 0
+
+
+@pytest.mark.parametrize("width, scale", [(64, None), (61, None), (64, 1.5)])
+def test_light_splatter_matches_draw_circle(width, scale):
+    """Non-overlapping stamps reproduce pygame.draw.circle exactly, including ones clipped by the border
+    and perspective-scaled ones."""
+    xs, ys = np.array([3.7, 20.2, 45.9, 60.5, 30.0]), np.array([4.1, 30.0, 15.5, 46.0, -2.0])
+    sizes = np.array([0.4, 5.5, 2.9, 7.0, 3.2], dtype=np.float32)
+    colors = np.array([[150, 10, 20], [200, 0, 30], [100, 30, 0], [120, 5, 5], [180, 20, 10]], dtype=np.uint8)
+    reference, splatted = (main.pygame.Surface((width, 48)) for _ in range(2))
+    for x, y, size, color in zip(xs, ys, sizes, colors.tolist()):
+        main.pygame.draw.circle(reference, color, (int(x), int(y)), max(1, int(size * (scale or 1))))
+    main.LightSplatter(splatted, sizes, colors).splat(splatted, xs, ys, np.ones(5, dtype=bool), scale and np.full(5, scale))
+    np.testing.assert_array_equal(main.pygame.surfarray.array3d(splatted), main.pygame.surfarray.array3d(reference))
+
+
+def test_light_splatter_skips_coordinates_beyond_int32():
+    """Lights projected far off screen, as at extreme zoom, draw nothing instead of wrapping around int32."""
+    surface = main.pygame.Surface((64, 48))
+    xs, ys = np.array([1e12, -1e12, 3e9, 30.0]), np.array([20.0, 20.0, -3e9, 1e11])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        main.LightSplatter(surface, np.full(4, 3.0, dtype=np.float32), np.full((4, 3), 200, dtype=np.uint8)).splat(
+            surface, xs, ys, np.ones(4, dtype=bool), np.full(4, 20.0))
+    assert not main.pygame.surfarray.array3d(surface).any()
+
+
+def test_light_grid_queries_match_linear_scans():
+    """Nearest-light and rectangle queries agree with brute force, including lights clamped into border cells
+    and hidden ones, which are never returned."""
+    rng = np.random.default_rng(5)
+    x, y = rng.uniform(-40, main.WIDTH + 40, 20000), rng.uniform(-40, main.HEIGHT + 40, 20000)
+    visible = rng.random(20000) < 0.8
+    grid = main.LightGrid(x, y, visible, (main.WIDTH, main.HEIGHT))
+    indexed = visible & (x >= -16) & (x < main.WIDTH + 16) & (y >= -16) & (y < main.HEIGHT + 16)
+    for px, py in rng.uniform(-10, [main.WIDTH + 10, main.HEIGHT + 10], size=(200, 2)):
+        d2 = np.where(indexed, (x - px) ** 2 + (y - py) ** 2, np.inf)
+        expected = int(np.argmin(d2)) if d2.min() <= 36 else None
+        assert grid.nearest(px, py, 6.0) == expected
+    for x0, y0, x1, y1 in [(100, 100, 300, 180), (500, 890, -20, 700), (0, 0, main.WIDTH, main.HEIGHT)]:
+        inside = indexed & (x >= min(x0, x1)) & (x <= max(x0, x1)) & (y >= min(y0, y1)) & (y <= max(y0, y1))
+        np.testing.assert_array_equal(np.sort(grid.in_rect(x0, y0, x1, y1)), np.flatnonzero(inside))
+    assert main.LightGrid(x, y, np.zeros(20000, dtype=bool), (main.WIDTH, main.HEIGHT)).nearest(600, 450, 50) is None
+
+
+def test_background_layer_glow_matches_stacked_rings():
+    """The cached multiply/add glow matches blitting each translucent ring over the same background."""
+    reference, cached = (main.pygame.Surface((100, 100)) for _ in range(2))
+    for surface in (reference, cached): surface.fill((40, 80, 120))
+    for r in range(main.STAR_GLOW_RADIUS, 0, -5):
+        ring = main.pygame.Surface((r * 2, r * 2), main.pygame.SRCALPHA)
+        main.pygame.draw.circle(ring, (255, 255, 255, 15), (r, r), r)
+        reference.blit(ring, (50 - r, 50 - r))
+    main.pygame.draw.circle(reference, (255, 255, 255), (50, 50), main.STAR_RADIUS)
+    main.BackgroundLayer((100, 100), np.empty(0, dtype=main.STAR_DTYPE)).draw_glow(cached, (50, 50))
+    diff = np.abs(main.pygame.surfarray.array3d(reference).astype(int) - main.pygame.surfarray.array3d(cached))
+    assert diff.max() <= 4
+
+
+def test_generate_bg_stars_matches_colorsys():
+    import colorsys
+    stars = main.generate_bg_stars(640, 480, 1000, np.random.default_rng(7))
+    assert stars.dtype == main.STAR_DTYPE
+    assert stars['x'].max() <= 640 and stars['y'].max() <= 480
+    assert ((0.5 <= stars['size']) & (stars['size'] <= 2.0)).all() and stars['brightness'].min() >= 100
+    hues = np.random.default_rng(7).random(1000) # First draw of the same generator
+    expected = [[int(c * 255) for c in colorsys.hsv_to_rgb(h, 1.0, 1.0)] for h in hues]
+    np.testing.assert_array_equal(stars['color'], expected)
+    assert (stars['slot'] == 0).all()
+
+
+def test_background_layer_twinkle_only_touches_changed_stars():
+    stars = np.array([(10 + 20 * i, 10, 1.5, 200, (255, 0, 0), 0) for i in range(5)], dtype=main.STAR_DTYPE)
+    layer = main.BackgroundLayer((100, 20), stars, np.random.default_rng(5))
+    before = main.pygame.surfarray.array3d(layer.surface)
+    layer.twinkle(rate=1.0)
+    after = main.pygame.surfarray.array3d(layer.surface)
+    changed_columns = np.flatnonzero(np.any(before != after, axis=(1, 2)))
+    assert all(abs(x - (10 + 20 * round((x - 10) / 20))) <= 2 for x in changed_columns)
+    assert (stars['brightness'] != 200).any()
+
+
+def test_indexed_background_twinkles_through_the_palette():
+    """Stars reference palette slots; twinkling rewrites palette entries, not pixels."""
+    stars = main.generate_bg_stars(80, 60, 50, np.random.default_rng(6), indexed=True)
+    assert ((1 <= stars['slot']) & (stars['slot'] <= main.STAR_HUES * main.STAR_TWINKLE_GROUPS)).all()
+    layer = main.IndexedBackgroundLayer((80, 60), stars, np.random.default_rng(7))
+    indices = main.pygame.surfarray.array2d(layer.surface)
+    assert set(np.unique(indices)) <= {0} | set(stars['slot'].tolist())
+    palette = layer.surface.get_palette()
+    layer.twinkle(rate=1.0)
+    np.testing.assert_array_equal(main.pygame.surfarray.array2d(layer.surface), indices)
+    assert layer.surface.get_palette() != palette
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_background_twinkle_follows_the_given_rng(indexed):
+    """Layers seeded alike twinkle alike, and leave numpy's global random state alone."""
+    layer_type = main.IndexedBackgroundLayer if indexed else main.BackgroundLayer
+    layers = [layer_type((80, 60), main.generate_bg_stars(80, 60, 50, np.random.default_rng(6), indexed=indexed),
+                         np.random.default_rng(3)) for _ in range(2)]
+    state = np.random.get_state()[1].copy()
+    for layer in layers:
+        for _ in range(5): layer.twinkle(rate=0.3)
+    np.testing.assert_array_equal(np.random.get_state()[1], state)
+    np.testing.assert_array_equal(*(main.pygame.surfarray.array3d(layer.surface) for layer in layers))
+    if indexed: assert layers[0].surface.get_palette() == layers[1].surface.get_palette()